@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.8"
+# dependencies = ["requests>=2.28.0"]
+# ///
+"""
+Exa Fetch benchmarks - runs exa_fetch commands against the mock server.
+
+Each (command, concurrency) cell runs in a fresh worker process so peak RSS
+is per cell. Reports p50/p95 latency, requests per second, formatted output
+bytes per second and peak RSS.
+
+Usage:
+    uv run bench.py                                 # all commands, concurrency 1,4,16
+    uv run bench.py --commands smart,contents --concurrency 1,8 --requests 200
+    uv run bench.py --latency 80 --jitter 30 --error-rate 0.05 --error-status 429,503
+    uv run bench.py --json > results.jsonl
+
+Commands: search, contents, code, smart (full CLI path with --no-cache) and
+format (formatter only, no HTTP).
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCH_DIR), "scripts")
+COMMANDS = ("search", "contents", "code", "smart", "format")
+
+QUERIES = [
+    "什么是 transformer 架构",
+    "Python asyncio 教程",
+    "React hooks example",
+    "github rust web framework",
+    "attention mechanism paper arxiv",
+    "latest LLM news",
+    "vector database deep dive",
+    "HTTP connection pooling",
+]
+URLS = [
+    "https://docs.python.org/article/0-python-asyncio-documentation",
+    "https://realpython.com/article/1-async-io-in-python",
+    "https://github.com/article/2-aio-libs/aiohttp",
+]
+
+
+# ============================================================================
+# Worker (one benchmark cell)
+# ============================================================================
+
+class CountingSink:
+    """Write-only text stream that only counts UTF-8 bytes."""
+
+    encoding = "utf-8"
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data: str) -> int:
+        self.bytes += len(data.encode("utf-8"))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def peak_rss_kb() -> Optional[int]:
+    """Peak resident set size of this process in KiB (None if unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def command_argv(command: str, i: int) -> List[str]:
+    """CLI arguments for the i-th operation of a command."""
+    query = QUERIES[i % len(QUERIES)]
+    if command == "contents":
+        return ["contents", *URLS, "--no-cache"]
+    return [command, query, "--no-cache"]
+
+
+def run_cell(command: str, concurrency: int, total: int) -> Dict[str, Any]:
+    """Run one benchmark cell in this process and return its measurements."""
+    sys.path.insert(0, SCRIPTS_DIR)
+    import exa_fetch
+
+    if command == "format":
+        with open(os.path.join(BENCH_DIR, "fixtures", "search.json"), "r", encoding="utf-8") as f:
+            results = json.load(f)["results"]
+
+        def operation(i: int):
+            output = exa_fetch.format_search_results(results, QUERIES[i % len(QUERIES)])
+            return 0, len(output.encode("utf-8")) + 1
+    else:
+        def operation(i: int):
+            return exa_fetch.run_command(command_argv(command, i)), 0
+
+    latencies = []
+
+    def timed(i: int):
+        start = time.perf_counter()
+        code, size = operation(i)
+        latencies.append(time.perf_counter() - start)
+        return code, size
+
+    sink = CountingSink()
+    saved = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = sink, CountingSink()
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, range(total)))
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout, sys.stderr = saved
+
+    formatted = sink.bytes + sum(size for _, size in outcomes)
+    return {
+        "command": command,
+        "concurrency": concurrency,
+        "requests": total,
+        "failures": sum(1 for code, _ in outcomes if code != 0),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "rps": round(total / elapsed, 1),
+        "bytes_per_s": round(formatted / elapsed),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def start_mock(args: argparse.Namespace) -> subprocess.Popen:
+    """Launch mock_server.py on a free port; its URL is stored on the process."""
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "mock_server.py"),
+        "--port", "0",
+        "--latency", str(args.latency),
+        "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+        "--error-status", args.error_status,
+        "--seed", "0",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line:
+        proc.kill()
+        raise RuntimeError("Mock server failed to start")
+    proc.url = line.strip().rsplit(" ", 1)[-1]
+    return proc
+
+
+def run_worker(command: str, concurrency: int, total: int, base_url: str) -> Dict[str, Any]:
+    """
+    Run one cell in a fresh process against base_url.
+
+    The worker gets a throwaway cache directory and no local index, so
+    benchmark runs never touch the user's cache, index or dictionaries.
+    """
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--commands", command,
+        "--concurrency", str(concurrency),
+        "--requests", str(total),
+    ]
+    with tempfile.TemporaryDirectory(prefix="exa_bench_") as cache_home:
+        env = dict(
+            os.environ,
+            EXA_BASE_URL=base_url,
+            EXA_RATE_LIMIT="0",
+            EXA_POOL_SIZE=str(max(10, concurrency)),
+            EXA_NO_DAEMON="1",
+            EXA_COORDINATE="",
+            EXA_INDEX="0",
+            EXA_HEDGE="",
+            EXA_ADAPTIVE="",
+            EXA_PREFETCH="0",
+            EXA_METRICS_FILE="",
+            XDG_CACHE_HOME=cache_home,
+        )
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{command} x{concurrency} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_header():
+    print("| command | conc | reqs | fail | p50 ms | p95 ms | req/s | out KB/s | peak RSS MB |")
+    print("|---------|-----:|-----:|-----:|-------:|-------:|------:|---------:|------------:|")
+
+
+def print_row(r: Dict[str, Any]):
+    rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r["peak_rss_kb"] else "-"
+    print(
+        f"| {r['command']} | {r['concurrency']} | {r['requests']} | {r['failures']} "
+        f"| {r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r['rps']:.1f} "
+        f"| {r['bytes_per_s'] / 1024:.0f} | {rss} |",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark exa_fetch against the mock Exa server",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--commands", default=",".join(COMMANDS),
+                        help=f"Comma-separated commands (default: {','.join(COMMANDS)})")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels (default: 1,4,16)")
+    parser.add_argument("--requests", "-n", type=int, default=50,
+                        help="Operations per command and concurrency level (default: 50)")
+    parser.add_argument("--base-url", default=None,
+                        help="Use an already running server instead of starting mock_server.py")
+    parser.add_argument("--latency", type=float, default=20.0, help="Mock latency in ms (default: 20)")
+    parser.add_argument("--jitter", type=float, default=5.0, help="Mock latency jitter in ms (default: 5)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock error rate (default: 0)")
+    parser.add_argument("--error-status", default="503", help="Mock error statuses (default: 503)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per cell")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    commands = [c.strip() for c in args.commands.split(",") if c.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    unknown = set(commands) - set(COMMANDS)
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(sorted(unknown))}")
+
+    if args.worker:
+        print(json.dumps(run_cell(commands[0], levels[0], args.requests)))
+        return
+
+    mock = None if args.base_url else start_mock(args)
+    base_url = args.base_url or mock.url
+    try:
+        if not args.json:
+            print(f"Target: {base_url}  ({args.requests} ops per cell)\n")
+            print_header()
+        for command in commands:
+            for level in levels:
+                row = run_worker(command, level, args.requests, base_url)
+                if args.json:
+                    print(json.dumps(row), flush=True)
+                else:
+                    print_row(row)
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.8"
+# ///
+"""
+Mock Exa API server - replays recorded /search and /contents fixtures.
+
+Lets exa_fetch.py, examples.py and the benchmarks run without spending API
+quota. Point the client at it with EXA_BASE_URL.
+
+Usage:
+    python mock_server.py [--port 8765] [--latency 50] [--jitter 20]
+                          [--slow-rate 0.05] [--slow-latency 2000]
+                          [--error-rate 0.05] [--error-status 429,503]
+
+    EXA_BASE_URL=http://127.0.0.1:8765 uv run ../scripts/exa_fetch.py smart "query"
+
+GET /stats returns request and injected-error counts; POST /stats/reset
+clears them.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CONTENT_FIELDS = ("text", "highlights", "highlightScores", "summary")
+
+
+# ============================================================================
+# Fixtures
+# ============================================================================
+
+def load_fixtures(directory: str = FIXTURES_DIR) -> Dict[str, Dict[str, Any]]:
+    """Load the recorded response for each endpoint ("search", "contents")."""
+    fixtures = {}
+    for name in ("search", "contents"):
+        with open(os.path.join(directory, f"{name}.json"), "r", encoding="utf-8") as f:
+            fixtures[name] = json.load(f)
+    return fixtures
+
+
+def replay_search(fixture: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a /search response from the fixture, honouring numResults and contents."""
+    recorded = fixture["results"]
+    count = int(payload.get("numResults", 10))
+    results = []
+    for i in range(count):
+        item = dict(recorded[i % len(recorded)])
+        if i >= len(recorded):
+            item["url"] = item["id"] = f"{item['url']}?page={i // len(recorded)}"
+        if "contents" not in payload:
+            for field in CONTENT_FIELDS:
+                item.pop(field, None)
+        results.append(item)
+    return {**fixture, "results": results}
+
+
+def replay_contents(fixture: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a /contents response with one recorded page per requested URL."""
+    recorded = fixture["results"]
+    by_url = {item["url"]: item for item in recorded}
+    results = []
+    statuses = []
+    for i, url in enumerate(payload.get("urls") or payload.get("ids") or []):
+        item = dict(by_url.get(url) or recorded[i % len(recorded)])
+        item["url"] = item["id"] = url
+        results.append(item)
+        statuses.append({"id": url, "status": "success"})
+    return {**fixture, "results": results, "statuses": statuses}
+
+
+# ============================================================================
+# Server
+# ============================================================================
+
+class MockExaServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding fixtures, fault settings and counters."""
+
+    daemon_threads = True
+    request_queue_size = 128  # default backlog of 5 drops SYNs at high concurrency
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        fixtures: Dict[str, Dict[str, Any]],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: Optional[List[int]] = None,
+        retry_after: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(address, MockExaHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [503]
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def fault(self) -> Tuple[float, Optional[int]]:
+        """Pick this request's delay and injected status (None = success)."""
+        with self.lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                delay = self.slow_latency  # latency tail, e.g. for request hedging
+            status = None
+            if self.random.random() < self.error_rate:
+                status = self.random.choice(self.error_statuses)
+        return max(0.0, delay) / 1000, status
+
+
+class MockExaHandler(BaseHTTPRequestHandler):
+    """Serves /search, /contents and /stats."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        blob = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(blob)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(blob)
+        self.server.record("bytes", len(blob))
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                stats = dict(self.server.stats)
+            self.send_json(200, stats)  # send_json records bytes under the same lock
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+
+        if self.path == "/stats/reset":
+            with self.server.lock:
+                self.server.stats = dict.fromkeys(self.server.stats, 0)
+            self.send_json(200, {"ok": True})
+            return
+
+        endpoint = self.path.strip("/")
+        if endpoint not in self.server.fixtures:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON body"})
+            return
+
+        self.server.record("requests")
+        delay, status = self.server.fault()
+        time.sleep(delay)
+        if status is not None:
+            self.server.record("errors")
+            headers = {}
+            if status == 429 and self.server.retry_after is not None:
+                headers["Retry-After"] = str(self.server.retry_after)
+            self.send_json(status, {"error": f"Injected {status}"}, headers)
+            return
+
+        fixture = self.server.fixtures[endpoint]
+        if endpoint == "search":
+            self.send_json(200, replay_search(fixture, payload))
+        else:
+            self.send_json(200, replay_contents(fixture, payload))
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    fixtures_dir: str = FIXTURES_DIR,
+    **options,
+) -> MockExaServer:
+    """Start a mock server on a background thread and return it (port 0 = any free port)."""
+    server = MockExaServer((host, port), load_fixtures(fixtures_dir), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Exa API server replaying recorded fixtures")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port, 0 = any free port (default: 8765)")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory with search.json and contents.json")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response latency in ms (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- latency jitter in ms (default: 0)")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Fraction of requests that take --slow-latency instead (default: 0)")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Latency of slow requests in ms (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (default: 0)")
+    parser.add_argument("--error-status", default="503",
+                        help="Comma-separated statuses to inject (default: 503)")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible faults")
+    args = parser.parse_args()
+
+    server = MockExaServer(
+        (args.host, args.port),
+        load_fixtures(args.fixtures),
+        latency=args.latency,
+        jitter=args.jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_status.split(",") if s.strip()],
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"Mock Exa API listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,14 @@ Exa Fetch Examples - 可执行示例集
     uv run examples.py news         # 新闻搜索示例
     uv run examples.py code         # 代码搜索示例
     uv run examples.py contents     # URL 抓取示例
+    uv run examples.py async        # 异步并发搜索示例
     uv run examples.py all          # 运行所有示例
 """
 
 import sys
 import os
+import time
+import asyncio
 
 # Add scripts directory to path
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -27,8 +30,8 @@ scripts_dir = os.path.join(script_dir, "scripts")
 sys.path.insert(0, scripts_dir)
 
 from exa_fetch import (
-    ExaClient, API_KEY,
-    detect_intent, get_intent_config,
+    ExaClient, AsyncExaClient, API_KEY,
+    detect_intent, classify_intent, get_intent_config,
     format_search_results, format_contents_results
 )
 
@@ -217,6 +220,42 @@ def example_contents():
     print(output)
 
 
+def example_async():
+    """示例 8: 异步并发搜索"""
+    print("=" * 60)
+    print("示例 8: 异步并发搜索 - 多个意图同时查询")
+    print("=" * 60)
+
+    queries = [
+        "什么是 transformer 架构",
+        "Python asyncio 教程入门",
+        "FastAPI dependency injection 代码示例",
+        "Python async HTTP client library github",
+    ]
+
+    async def run():
+        async with AsyncExaClient(API_KEY, max_concurrency=4) as client:
+            tasks = []
+            for query in queries:
+                config = get_intent_config(detect_intent(query), query)
+                tasks.append(client.search(
+                    query=query,
+                    search_type=config["search_type"],
+                    num_results=config["num_results"],
+                    category=config.get("category"),
+                    include_domains=config.get("include_domains"),
+                    contents=config.get("contents"),
+                ))
+            return await asyncio.gather(*tasks)
+
+    started = time.monotonic()
+    results = asyncio.run(run())
+    print(f"{len(queries)} 个查询并发完成，耗时 {time.monotonic() - started:.2f}s\n")
+
+    for query, result in zip(queries, results):
+        print(format_search_results(result.get("results", []), query))
+
+
 def example_intent_detection():
     """示例: 意图检测演示"""
     print("=" * 60)
@@ -234,11 +273,12 @@ def example_intent_detection():
         "React hooks best practices",
     ]
 
-    print("\n查询 -> 检测到的意图\n")
+    print("\n查询 -> 检测到的意图 (置信度)\n")
     for query in test_queries:
         intent = detect_intent(query)
+        ranked = ", ".join(f"{name} {conf:.0%}" for name, conf in classify_intent(query))
         print(f"  \"{query}\"")
-        print(f"    -> {intent}")
+        print(f"    -> {intent}" + (f"  ({ranked})" if ranked else ""))
         print()
 
 
@@ -253,6 +293,7 @@ def print_help():
     print("  news      - 新闻搜索")
     print("  code      - 代码示例搜索")
     print("  contents  - URL 内容抓取")
+    print("  async     - 异步并发搜索（AsyncExaClient）")
     print("  intent    - 意图检测演示（不调用 API）")
     print("  all       - 运行所有示例")
     print()
@@ -285,6 +326,7 @@ def main():
         "news": example_news,
         "code": example_code,
         "contents": example_contents,
+        "async": example_async,
     }
 
     if cmd == "all":
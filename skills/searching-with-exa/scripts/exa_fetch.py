@@ -20,26 +20,225 @@ Usage:
     # Code context mode (focused on code examples)
     uv run exa_fetch.py code "query" [options]
 
+    # Local mode (full-text search of previously fetched pages, offline)
+    uv run exa_fetch.py local "query" [-n N]
+
+    # Batch mode (many queries concurrently, one per line or JSONL)
+    uv run exa_fetch.py batch queries.txt [--workers N]
+
+    # Resident daemon; later search/contents/code/smart calls forward to it
+    uv run exa_fetch.py serve [--idle-timeout SECONDS]
+
 Intent types: concept, tutorial, example, github, paper, news, research, auto
 """
 
+from __future__ import annotations
+
+import os
+import re
 import sys
+import io
 import json
-import argparse
-import requests
-from typing import Optional, List, Dict, Any, Tuple
-from urllib.parse import urlparse
+import math
+import time
+import queue
+import random
+import socket
+import codecs
+import zlib
+import hashlib
+import functools
+import contextlib
+import itertools
+import threading
+import importlib.util
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Iterator, Mapping, BinaryIO, Callable
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 from datetime import datetime, timedelta
 
+
+def _lazy_import(name: str):
+    """Import a module on first attribute access, keeping CLI startup fast."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+# Heavy modules are only loaded once a command actually needs them, so
+# forwarding to the daemon (and --help) never pays for them.
+requests = _lazy_import("requests")
+asyncio = _lazy_import("asyncio")
+argparse = _lazy_import("argparse")
+concurrent_futures = _lazy_import("concurrent.futures")
+urllib3 = _lazy_import("urllib3")
+sqlite3 = _lazy_import("sqlite3")
+
 # ============================================================================
 # Configuration
 # ============================================================================
 
 API_KEY = ""  # Replace with your actual API key
-BASE_URL = "https://api.exa.ai"
+BASE_URL = os.environ.get("EXA_BASE_URL", "https://api.exa.ai")  # override to target a mock server
 DEFAULT_NUM_RESULTS = 10
 DEFAULT_SEARCH_TYPE = "deep"
 DEFAULT_TIMEOUT = 60  # seconds
+DEFAULT_POOL_SIZE = int(os.environ.get("EXA_POOL_SIZE", "10"))  # connections per host
+DEFAULT_BATCH_WORKERS = 8
+DEFAULT_ASYNC_CONCURRENCY = 8  # requests in flight per AsyncExaClient
+DEFAULT_CONTENTS_CHUNK_SIZE = 5  # URLs per /contents request
+DEFAULT_CONTENTS_WORKERS = 4
+STREAM_CHUNK_SIZE = 16 * 1024  # bytes read per step when streaming responses
+
+# Output
+OUTPUT_FORMATS = ("markdown", "json", "jsonl")
+OUTPUT_SCHEMA = "exa_fetch/v1"  # bump when JSON record fields change
+
+HIGHLIGHT_CHARS = 300
+SEARCH_HIGHLIGHTS = 3
+CONTENTS_HIGHLIGHTS = 5
+SEARCH_PREVIEW_CHARS = 500
+CONTENTS_PREVIEW_CHARS = 1000
+CONTENTS_SECTION_CHARS = 4000  # contents --section size, and --range length without END
+
+# Profiling (--profile / --metrics-file)
+METRICS_FILE = os.environ.get("EXA_METRICS_FILE")  # default --metrics-file
+
+# Output token budget (--max-output-tokens)
+MIN_SECTION_TOKENS = 16  # don't start a summary/highlight/text section with less room
+SECTION_OVERHEAD_TOKENS = 8  # section label / field name
+BUDGET_SAFETY = 0.95  # estimates are approximate; keep some headroom
+DOCUMENT_OVERHEAD_TOKENS = 24  # heading / JSON envelope
+RESULT_OVERHEAD_TOKENS = {"markdown": 24, "json": 80, "jsonl": 80}  # labels and fields per result
+
+# Rate limiting and retries (shared by all requests in a process)
+RATE_LIMIT = float(os.environ.get("EXA_RATE_LIMIT", "5"))  # requests/second, 0 disables
+RATE_BURST = int(os.environ.get("EXA_RATE_BURST", "5"))
+MAX_RETRIES = int(os.environ.get("EXA_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 30.0  # seconds
+RETRY_BUDGET_RATIO = 0.2  # retries earned per request sent
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Cross-process coordination (opt-in with --coordinate or EXA_COORDINATE=1)
+COORDINATE = os.environ.get("EXA_COORDINATE", "") == "1"
+GLOBAL_RATE_LIMIT = float(os.environ.get("EXA_GLOBAL_RATE_LIMIT", str(RATE_LIMIT)))
+COALESCE_WAIT = 3 * DEFAULT_TIMEOUT  # seconds to wait for another process's identical request
+
+# Response cache
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "exa_fetch",
+)
+CACHE_TTL = 24 * 3600  # seconds
+NEWS_CACHE_TTL = 30 * 60  # seconds, news results go stale quickly
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_EVICT_INTERVAL = 300  # seconds between size checks; the cache may overshoot max_bytes in between
+
+# Hedged requests (--hedge / --hedge-fast): back up a request that is slower than usual
+HEDGE = os.environ.get("EXA_HEDGE", "")  # "1" = default --hedge, "fast" = default --hedge-fast
+HEDGE_PERCENTILE = float(os.environ.get("EXA_HEDGE_PERCENTILE", "95"))  # of recent latencies
+HEDGE_BUDGET_RATIO = float(os.environ.get("EXA_HEDGE_BUDGET", "0.1"))  # hedges earned per request sent
+HEDGE_MAX_TOKENS = 5  # hedges that can be saved up
+HEDGE_MIN_SAMPLES = 10  # latencies needed before an endpoint is hedged
+HEDGE_MIN_DELAY = 0.1  # seconds, never hedge sooner
+LATENCY_WINDOW = 100  # latencies kept per endpoint and search type
+LATENCY_HISTORY = os.path.join(CACHE_DIR, "latency.json")
+HEDGE_FALLBACK_FIELD = "_hedgeFallback"  # marks a response served by the fast fallback
+
+# Compressed page text in the response cache and local index
+COMPRESSION = os.environ.get("EXA_COMPRESSION", "auto")  # auto (zstd if installed, else zlib) | zstd | zlib
+BLOB_MIN_CHARS = 1024  # shorter texts are stored as they are
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 12
+DICT_DIR = os.path.join(CACHE_DIR, "dicts")
+DICT_SAMPLES = 8  # pages of one domain to collect before training its dictionary
+DICT_SAMPLE_CHARS = 16 * 1024  # characters kept per sample page
+DICT_MAX_BYTES = 32 * 1024  # zlib's window; earlier dictionary bytes are unreachable
+DICT_SAMPLE_DOMAINS = 32  # domains sampled at once; the least recently seen is dropped
+DICT_MAX_DOMAINS = 256  # trained domains; later domains are compressed without a dictionary
+
+# Recorded sessions (--record DIR / --replay DIR)
+RECORD_DIR = os.environ.get("EXA_RECORD")  # default --record
+REPLAY_DIR = os.environ.get("EXA_REPLAY")  # default --replay
+RECORD_IGNORED_FIELDS = ("startPublishedDate",)  # derived from today's date by intents like news
+
+# Speculative prefetch (--prefetch N): fetch top results' contents in the background
+PREFETCH_DEFAULT = int(os.environ.get("EXA_PREFETCH", "0"))  # URLs per search, 0 disables
+DAILY_QUOTA = int(os.environ.get("EXA_DAILY_QUOTA", "1000"))  # API units budgeted per day
+PREFETCH_SHARE = float(os.environ.get("EXA_PREFETCH_SHARE", "0.1"))  # share of DAILY_QUOTA for prefetch
+
+# Local full-text index of every fetched page (EXA_INDEX=0 disables)
+INDEX_ENABLED = os.environ.get("EXA_INDEX", "1") != "0"
+INDEX_PATH = os.environ.get("EXA_INDEX_PATH") or os.path.join(CACHE_DIR, "index.sqlite3")
+LOCAL_MIN_RESULTS = 3  # --prefer-local search needs this many hits (or num_results if fewer)
+INDEX_FIELD_WEIGHTS = (10.0, 5.0, 3.0, 1.0)  # bm25 weights: title, summary, highlights, text
+
+# Two-phase search (--two-phase): fast search without contents, then fetch the top-k
+TWO_PHASE_TOP = 3
+
+# Adaptive search type (smart --adaptive): cheapest type whose results are good enough
+ADAPTIVE = os.environ.get("EXA_ADAPTIVE", "") == "1"  # default --adaptive
+SEARCH_TYPE_LADDER = ("fast", "neural", "deep")  # cheapest first
+SEARCH_TYPE_STATS = os.path.join(CACHE_DIR, "search_types.json")
+ADAPTIVE_QUALITY = 0.6  # quality proxy (0-1) a search type must reach
+ADAPTIVE_OVERLAP = 0.5  # learned top-result overlap (0-1) with the next type up that a type must reach
+ADAPTIVE_MIN_SAMPLES = 5  # samples before a type's learned overlap is trusted
+ADAPTIVE_EXPLORE = 0.05  # chance of retrying a type that has been skipped as too weak
+ADAPTIVE_DECAY = 0.2  # weight of the newest sample in the running averages
+
+# Incremental news watch (watch command)
+WATCH_STATE = os.path.join(CACHE_DIR, "watch.json")
+WATCH_SEEN_MAX = 1000  # seen URLs remembered per watched query
+
+# Multi-query merge (multi command)
+MERGE_RRF_K = 60  # reciprocal rank fusion constant
+NEAR_DUP_BITS = 3  # simhash distance at or below which two pages are near-duplicates
+TRACKING_PARAMS = frozenset({
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref_src", "ref_url", "_hsenc", "_hsmi",
+})
+# Generic names that only mean tracking on some sites (elsewhere, e.g. GitHub's
+# ?ref=<branch>, they select different content)
+HOST_TRACKING_PARAMS = {
+    "youtube.com": frozenset({"si"}),
+    "youtu.be": frozenset({"si"}),
+    "open.spotify.com": frozenset({"si"}),
+    "taobao.com": frozenset({"spm"}),
+    "tmall.com": frozenset({"spm"}),
+    "aliyun.com": frozenset({"spm"}),
+    "alibaba.com": frozenset({"spm"}),
+    "producthunt.com": frozenset({"ref"}),
+}
+
+# User-defined intents (see load_user_intents)
+INTENTS_FILE = os.environ.get("EXA_INTENTS_FILE") or os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config"),
+    "exa_fetch",
+    "intents.json",
+)
+
+# Resident daemon (exa_fetch.py serve); set EXA_NO_DAEMON=1 to never forward
+DAEMON_SOCKET = os.environ.get("EXA_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or CACHE_DIR, "exa_fetch.sock"
+)
+DAEMON_COMMANDS = ("search", "contents", "code", "smart", "local", "multi", "watch")  # commands forwarded to the daemon
+DAEMON_IDLE_TIMEOUT = 30 * 60  # seconds without requests before the daemon exits
+DAEMON_DECLINE_TIMEOUT = 2  # seconds to read a request the busy daemon declines
+# Settings are read once at startup, so callers whose values differ run locally
+DAEMON_ENV_NAMES = ("HOME", "XDG_CACHE_HOME", "XDG_CONFIG_HOME")  # besides EXA_* settings
+DAEMON_ENV_IGNORED = ("EXA_SOCKET", "EXA_NO_DAEMON")
 
 
 # ============================================================================
@@ -79,6 +278,312 @@ INTENT_KEYWORDS = {
 }
 
 
+# Per-intent search templates, frozen into INTENT_REGISTRY at import.
+# "{query}" in any string is replaced with the user's query and
+# "start_days" becomes a rolling "start_date".
+INTENT_TEMPLATES = {
+    "concept": {
+        "search_type": "neural",
+        "num_results": 10,
+        "category": None,
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "summary": {
+                "query": "Provide a clear and comprehensive explanation of this concept"
+            },
+            "highlights": {
+                "numSentences": 3,
+                "highlightsPerUrl": 3,
+                "query": "key definitions and explanations"
+            }
+        }
+    },
+    "tutorial": {
+        "search_type": "auto",
+        "num_results": 10,
+        "category": None,
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "highlights": {
+                "numSentences": 3,
+                "highlightsPerUrl": 5,
+                "query": "step-by-step instructions and practical examples"
+            }
+        }
+    },
+    "example": {
+        "search_type": "auto",
+        "num_results": 10,
+        "category": None,
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "highlights": {
+                "numSentences": 2,
+                "highlightsPerUrl": 5,
+                "query": "code snippets and usage examples"
+            }
+        }
+    },
+    "github": {
+        "search_type": "neural",
+        "num_results": 10,
+        "category": "github",
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "summary": {
+                "query": "What is this repository about and what are its main features?"
+            }
+        }
+    },
+    "paper": {
+        "search_type": "neural",
+        "num_results": 10,
+        "category": "research paper",
+        "include_domains": ["arxiv.org", "paperswithcode.com"],
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "summary": {
+                "query": "Summarize the research problem, methodology, and key findings"
+            }
+        }
+    },
+    "news": {
+        "search_type": "auto",
+        "num_results": 10,
+        "category": "news",
+        "include_domains": None,
+        "start_days": 7,
+        "cache_ttl": NEWS_CACHE_TTL,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "highlights": {
+                "numSentences": 2,
+                "highlightsPerUrl": 3
+            }
+        }
+    },
+    "research": {
+        "search_type": "deep",
+        "num_results": 15,
+        "category": None,
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "summary": {
+                "query": "Provide a comprehensive overview of this topic"
+            },
+            "highlights": {
+                "numSentences": 3,
+                "highlightsPerUrl": 5,
+                "query": "{query}"
+            }
+        }
+    },
+    "auto": {
+        "search_type": "deep",
+        "num_results": 10,
+        "category": None,
+        "include_domains": None,
+        "contents": {
+            "text": True,
+            "livecrawl": "fallback",
+            "highlights": {
+                "numSentences": 3,
+                "highlightsPerUrl": 3,
+                "query": "{query}"
+            },
+            "summary": {
+                "query": "Summarize the key points about: {query}"
+            }
+        }
+    }
+}
+
+
+def load_user_intents(path: str = INTENTS_FILE) -> Tuple[Dict[str, List[str]], Dict[str, Dict[str, Any]]]:
+    """
+    Load extra or overridden intents from a JSON file.
+
+    The file maps intent names to template fields plus optional
+    "keywords", e.g.::
+
+        {"changelog": {"keywords": ["changelog", "更新日志"], "search_type": "fast"},
+         "news": {"num_results": 20}}
+
+    Fields are merged over the built-in template of the same name, or over
+    "auto" for new intents.
+
+    Returns:
+        Tuple of (intent -> extra keywords, intent -> template overrides)
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}, {}
+    except (OSError, ValueError) as e:
+        print(f"WARN: Ignoring intents file {path}: {e}", file=sys.stderr)
+        return {}, {}
+
+    if not isinstance(data, dict) or not all(isinstance(v, dict) for v in data.values()):
+        print(f"WARN: Ignoring intents file {path}: expected an object of objects", file=sys.stderr)
+        return {}, {}
+
+    keywords = {}
+    overrides = {}
+    for name, spec in data.items():
+        spec = dict(spec)
+        keywords[name] = [str(kw) for kw in spec.pop("keywords", [])]
+        overrides[name] = spec
+    return keywords, overrides
+
+
+def _freeze(value: Any) -> Any:
+    """Recursively convert dicts/lists into read-only mappings/tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _render(value: Any, query: str) -> Any:
+    """Copy a frozen template into plain dicts/lists, filling in "{query}"."""
+    if isinstance(value, Mapping):
+        return {k: _render(v, query) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_render(v, query) for v in value]
+    if isinstance(value, str) and "{query}" in value:
+        return value.replace("{query}", query)
+    return value
+
+
+def build_intent_registry(
+    templates: Dict[str, Dict[str, Any]],
+    overrides: Dict[str, Dict[str, Any]],
+) -> Mapping[str, Mapping[str, Any]]:
+    """Merge user overrides over the built-in templates and freeze the result."""
+    merged = dict(templates)
+    for name, override in overrides.items():
+        merged[name] = {**merged.get(name, templates["auto"]), **override}
+    return MappingProxyType({name: _freeze(template) for name, template in merged.items()})
+
+
+def intents_signature(path: str = INTENTS_FILE) -> Optional[Tuple[float, int]]:
+    """(mtime, size) of the intents file, None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+# A resident daemon compares this to notice edits it has not loaded
+_INTENTS_SIGNATURE = intents_signature()
+_USER_KEYWORDS, _USER_TEMPLATES = load_user_intents()
+INTENT_REGISTRY = build_intent_registry(INTENT_TEMPLATES, _USER_TEMPLATES)
+INTENT_CHOICES = ["auto"] + [name for name in INTENT_REGISTRY if name != "auto"]
+
+# Built-in keywords keep their tie-break priority ahead of user additions
+_ALL_INTENT_KEYWORDS = {name: list(kws) for name, kws in INTENT_KEYWORDS.items()}
+for _name, _kws in _USER_KEYWORDS.items():
+    _ALL_INTENT_KEYWORDS.setdefault(_name, []).extend(_kws)
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Build a regex matching any of `words`, factored as a prefix trie."""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and "" not in node else f"(?:{'|'.join(branches)})"
+        # Optional tail = a shorter keyword ends here; greedy, so longest wins
+        return f"{body}?" if "" in node else body
+
+    return build(trie)
+
+
+def compile_intent_matcher(
+    keywords: Dict[str, List[str]],
+) -> Tuple["re.Pattern", Dict[str, Tuple[int, ...]]]:
+    """
+    Compile every intent keyword into one regex.
+
+    Keywords are merged into a prefix trie so the regex engine never
+    re-tries shared prefixes, and one findall() pass reports every keyword
+    in a query (longest match wins where keywords nest).
+
+    Returns:
+        Tuple of (pattern, keyword -> indexes of the intents it votes for)
+    """
+    keyword_intents: Dict[str, List[int]] = {}
+    for index, kws in enumerate(keywords.values()):
+        for kw in kws:
+            keyword_intents.setdefault(kw.lower(), []).append(index)
+
+    pattern = re.compile(_trie_regex(keyword_intents))
+    return pattern, {kw: tuple(indexes) for kw, indexes in keyword_intents.items()}
+
+
+_INTENT_NAMES = list(_ALL_INTENT_KEYWORDS)
+_INTENT_PATTERN, _KEYWORD_INTENTS = compile_intent_matcher(_ALL_INTENT_KEYWORDS)
+
+
+def _intent_scores(query: str) -> Optional[List[int]]:
+    """Count the distinct keywords voting for each intent; None if nothing matched."""
+    found = _INTENT_PATTERN.findall(query.lower())
+    if not found:
+        return None
+    scores = [0] * len(_INTENT_NAMES)
+    for kw in set(found):
+        for index in _KEYWORD_INTENTS[kw]:
+            scores[index] += 1
+    return scores
+
+
+def classify_intent(query: str) -> List[Tuple[str, float]]:
+    """
+    Score every intent against a query in one pass.
+
+    Each distinct keyword found votes for its intents; ties go to the
+    intent listed first in INTENT_KEYWORDS.
+
+    Args:
+        query: User search query
+
+    Returns:
+        (intent, confidence) pairs, best first, confidences summing to 1.
+        Empty if no keyword matched.
+    """
+    scores = _intent_scores(query)
+    if scores is None:
+        return []
+    total = sum(scores)
+    ranked = sorted(
+        (index for index, score in enumerate(scores) if score),
+        key=lambda index: (-scores[index], index),
+    )
+    return [(_INTENT_NAMES[index], scores[index] / total) for index in ranked]
+
+
 def detect_intent(query: str) -> str:
     """
     Detect user query intent based on keywords.
@@ -89,13 +594,16 @@ def detect_intent(query: str) -> str:
     Returns:
         Intent type: concept, tutorial, example, github, paper, news, research, or auto
     """
-    query_lower = query.lower()
+    scores = _intent_scores(query)
+    if scores is None:
+        return "auto"
+    # index() returns the first maximum, i.e. the higher-priority intent on ties
+    return _INTENT_NAMES[scores.index(max(scores))]
 
-    for intent, keywords in INTENT_KEYWORDS.items():
-        if any(kw in query_lower for kw in keywords):
-            return intent
 
-    return "auto"
+def detect_intents(queries: Iterable[str]) -> List[str]:
+    """Detect intents for many queries (e.g. a whole query log) in bulk."""
+    return [detect_intent(query) for query in queries]
 
 
 def get_intent_config(intent: str, query: str) -> Dict[str, Any]:
@@ -109,392 +617,4035 @@ def get_intent_config(intent: str, query: str) -> Dict[str, Any]:
     Returns:
         Configuration dict with search parameters
     """
-    configs = {
-        "concept": {
-            "search_type": "neural",
-            "num_results": 10,
-            "category": None,
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "summary": {
-                    "query": "Provide a clear and comprehensive explanation of this concept"
-                },
-                "highlights": {
-                    "numSentences": 3,
-                    "highlightsPerUrl": 3,
-                    "query": "key definitions and explanations"
-                }
-            }
-        },
-        "tutorial": {
-            "search_type": "auto",
-            "num_results": 10,
-            "category": None,
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "highlights": {
-                    "numSentences": 3,
-                    "highlightsPerUrl": 5,
-                    "query": "step-by-step instructions and practical examples"
-                }
-            }
-        },
-        "example": {
-            "search_type": "auto",
-            "num_results": 10,
-            "category": None,
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "highlights": {
-                    "numSentences": 2,
-                    "highlightsPerUrl": 5,
-                    "query": "code snippets and usage examples"
-                }
-            }
-        },
-        "github": {
-            "search_type": "neural",
-            "num_results": 10,
-            "category": "github",
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "summary": {
-                    "query": "What is this repository about and what are its main features?"
-                }
-            }
-        },
-        "paper": {
-            "search_type": "neural",
-            "num_results": 10,
-            "category": "research paper",
-            "include_domains": ["arxiv.org", "paperswithcode.com"],
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "summary": {
-                    "query": "Summarize the research problem, methodology, and key findings"
-                }
-            }
-        },
-        "news": {
-            "search_type": "auto",
-            "num_results": 10,
-            "category": "news",
-            "include_domains": None,
-            "start_date": (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%dT00:00:00.000Z"),
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "highlights": {
-                    "numSentences": 2,
-                    "highlightsPerUrl": 3
-                }
-            }
-        },
-        "research": {
-            "search_type": "deep",
-            "num_results": 15,
-            "category": None,
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "summary": {
-                    "query": "Provide a comprehensive overview of this topic"
-                },
-                "highlights": {
-                    "numSentences": 3,
-                    "highlightsPerUrl": 5,
-                    "query": query
-                }
-            }
-        },
-        "auto": {
-            "search_type": "deep",
-            "num_results": 10,
-            "category": None,
-            "include_domains": None,
-            "contents": {
-                "text": True,
-                "livecrawl": "fallback",
-                "highlights": {
-                    "numSentences": 3,
-                    "highlightsPerUrl": 3,
-                    "query": query
-                },
-                "summary": {
-                    "query": f"Summarize the key points about: {query}"
-                }
-            }
-        }
-    }
+    config = _render(INTENT_REGISTRY.get(intent, INTENT_REGISTRY["auto"]), query)
 
-    return configs.get(intent, configs["auto"])
+    start_days = config.pop("start_days", None)
+    if start_days is not None:
+        start = datetime.now() - timedelta(days=start_days)
+        config["start_date"] = start.strftime("%Y-%m-%dT00:00:00.000Z")
+
+    return config
 
 
 # ============================================================================
-# API Client
+# Compressed Text
 # ============================================================================
 
-class ExaClient:
-    """Minimal Exa API client."""
+@functools.lru_cache(maxsize=None)
+def _zstd_module() -> Optional[Any]:
+    """The optional zstandard package, or None if it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
 
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.headers = {
-            "x-api-key": api_key,
-            "Content-Type": "application/json"
-        }
 
-    def search(
-        self,
-        query: str,
-        search_type: str = DEFAULT_SEARCH_TYPE,
-        num_results: int = DEFAULT_NUM_RESULTS,
-        category: Optional[str] = None,
-        include_domains: Optional[List[str]] = None,
-        exclude_domains: Optional[List[str]] = None,
-        start_published_date: Optional[str] = None,
-        contents: Optional[Dict[str, Any]] = None,
-    ) -> Dict[str, Any]:
-        """Execute search with optional content fetching."""
-        payload = {
-            "query": query,
-            "type": search_type,
-            "numResults": num_results,
-        }
+def build_dictionary(samples: List[str], max_bytes: int = DICT_MAX_BYTES) -> bytes:
+    """
+    Build a preset dictionary from the lines shared by at least two pages.
 
-        if category:
-            payload["category"] = category
-        if include_domains:
-            payload["includeDomains"] = include_domains
-        if exclude_domains:
-            payload["excludeDomains"] = exclude_domains
-        if start_published_date:
-            payload["startPublishedDate"] = start_published_date
-        if contents:
-            payload["contents"] = contents
-
-        response = requests.post(
-            f"{BASE_URL}/search",
-            json=payload,
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT
-        )
-        response.raise_for_status()
-        return response.json()
+    The most common lines go last, where zlib and zstd reach them with the
+    shortest match distance. Returns b"" if the pages share too little.
+    """
+    counts: Dict[str, int] = {}
+    for sample in samples:
+        for line in {line.strip() for line in sample.splitlines()}:
+            if len(line) >= 16:
+                counts[line] = counts.get(line, 0) + 1
+    shared = sorted((line for line, n in counts.items() if n >= 2), key=lambda line: (counts[line], line))
+    blob = "\n".join(shared).encode("utf-8")[-max_bytes:]
+    return blob if len(blob) >= 256 else b""
 
-    def get_contents(
-        self,
-        urls: List[str],
-        text: bool = True,
-        highlights: Optional[Dict[str, Any]] = None,
-        summary: Optional[Dict[str, Any]] = None,
-        livecrawl: str = "fallback",
-    ) -> Dict[str, Any]:
-        """Fetch content from URLs."""
-        payload = {
-            "urls": urls,
-            "livecrawl": livecrawl,
-        }
 
-        if text:
-            payload["text"] = True
-        if highlights:
-            payload["highlights"] = highlights
-        if summary:
-            payload["summary"] = summary
+class TextCodec:
+    """
+    Compress page text with zstd (if installed) or zlib and per-domain dictionaries.
 
-        response = requests.post(
-            f"{BASE_URL}/contents",
-            json=payload,
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT
-        )
-        response.raise_for_status()
-        return response.json()
+    Pages of one site repeat the same navigation, footers and banners. Once
+    DICT_SAMPLES pages of a domain have been seen, the lines they share are
+    saved as a dictionary that later pages of the domain are compressed
+    against. Dictionaries are never modified or evicted (cached and indexed
+    blobs may still need them), so the number of trained domains is capped
+    instead, as is the number of domains being sampled. Every blob names
+    the codec and dictionary it needs:
 
+        b"<zlib|zstd> <dictionary id or -> <raw bytes>\\n" + compressed data
+    """
 
-# ============================================================================
-# Output Formatting
-# ============================================================================
+    def __init__(self, directory: str = DICT_DIR, method: str = COMPRESSION):
+        self.directory = directory
+        if method == "zstd" and _zstd_module() is None:
+            print("WARN: zstandard is not installed, compressing with zlib", file=sys.stderr)
+        self.method = "zstd" if method in ("auto", "zstd") and _zstd_module() is not None else "zlib"
+        self._dicts: Dict[str, bytes] = {}
 
-def extract_domain(url: str) -> str:
-    """Extract domain from URL."""
-    try:
-        parsed = urlparse(url)
-        return parsed.netloc or url
-    except Exception:
-        return url
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
 
+    @staticmethod
+    def _domain_file(domain: str) -> str:
+        return re.sub(r"[^a-z0-9.-]", "_", domain.lower())[:100] or "_"
 
-def format_date(date_str: Optional[str]) -> str:
-    """Format date string for display."""
-    if not date_str:
-        return "N/A"
-    try:
-        # Handle ISO format
-        if "T" in date_str:
-            dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-            return dt.strftime("%Y-%m-%d")
-        return date_str[:10]  # YYYY-MM-DD
-    except Exception:
-        return date_str[:10] if len(date_str) >= 10 else date_str
+    def _write(self, name: str, data: bytes):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
 
+    def _dictionary(self, dict_id: str) -> bytes:
+        data = self._dicts.get(dict_id)
+        if data is None:
+            with open(self._path(f"{dict_id}.zdict"), "rb") as f:
+                data = self._dicts[dict_id] = f.read()
+        return data
 
-def format_search_results(results: List[Dict], query: str) -> str:
-    """Format search results as Markdown."""
-    if not results:
-        return f"## 搜索结果: \"{query}\"\n\n未找到相关结果。"
+    def _domain_dictionary(self, domain: str) -> Optional[str]:
+        """Dictionary id for a domain, "-" if its pages share nothing, None while still sampling."""
+        try:
+            with open(self._path(f"{self._domain_file(domain)}.current"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
 
-    lines = [f"## 搜索结果: \"{query}\"", ""]
+    def _files(self, subdirectory: str = "") -> List[Tuple[str, os.stat_result]]:
+        """(name, stat) of the files in the dictionary directory or a subdirectory of it."""
+        files = []
+        try:
+            with os.scandir(self._path(subdirectory)) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and not entry.name.endswith(".tmp"):
+                            files.append((entry.name, entry.stat()))
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return files
 
-    for i, item in enumerate(results, 1):
-        title = item.get("title", "无标题")
-        url = item.get("url", "")
-        domain = extract_domain(url)
-        date = format_date(item.get("publishedDate"))
-        summary = item.get("summary", "")
-        highlights = item.get("highlights", [])
-        text = item.get("text", "")
+    def _make_room_for_samples(self, samples_path: str) -> bool:
+        """
+        Whether a new domain may start sampling: none once DICT_MAX_DOMAINS
+        are trained, and at most DICT_SAMPLE_DOMAINS at a time (dropping the
+        least recently seen one to make room).
+        """
+        trained = sum(1 for name, _ in self._files() if name.endswith(".current"))
+        if trained >= DICT_MAX_DOMAINS:
+            return False
+        sampling = sorted((st.st_mtime, name) for name, st in self._files("samples"))
+        for _, name in sampling[:max(0, len(sampling) - DICT_SAMPLE_DOMAINS + 1)]:
+            try:
+                os.remove(os.path.join(os.path.dirname(samples_path), name))
+            except OSError:
+                pass
+        return True
 
-        lines.append(f"### {i}. [{title}]({url})")
-        lines.append(f"**来源**: {domain} | **日期**: {date}")
-        lines.append("")
+    def _observe(self, domain: str, text: str):
+        """Keep a sample page and train the domain's dictionary once there are enough."""
+        name = self._domain_file(domain)
+        samples_path = self._path(os.path.join("samples", f"{name}.jsonl"))
+        sample = text[:DICT_SAMPLE_CHARS]
+        try:
+            if not os.path.exists(samples_path) and not self._make_room_for_samples(samples_path):
+                return
+            os.makedirs(os.path.dirname(samples_path), exist_ok=True)
+            with open(samples_path, "a+", encoding="utf-8") as f:
+                f.seek(0)
+                samples = [json.loads(line) for line in f if line.strip()]
+                # The cache and the index both compress the same page
+                if sample in samples:
+                    return
+                f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+            samples.append(sample)
+            if len(samples) < DICT_SAMPLES:
+                return
+            zdict = build_dictionary(samples)
+            dict_id = hashlib.sha256(zdict).hexdigest()[:16] if zdict else "-"
+            if zdict:
+                self._write(f"{dict_id}.zdict", zdict)
+            self._write(f"{name}.current", dict_id.encode("ascii"))
+            os.remove(samples_path)
+        except (OSError, ValueError):
+            pass
 
-        # Summary
-        if summary:
-            lines.append(f"**摘要**: {summary}")
-            lines.append("")
+    def encode(self, text: str, domain: str = "") -> bytes:
+        """Compress text, using the domain's dictionary once it has one."""
+        raw = text.encode("utf-8")
+        dict_id = self._domain_dictionary(domain) if domain else "-"
+        if dict_id is None:
+            self._observe(domain, text)
+            dict_id = "-"
+        zdict = b""
+        if dict_id != "-":
+            try:
+                zdict = self._dictionary(dict_id)
+            except OSError:
+                dict_id = "-"
 
-        # Highlights
-        if highlights:
-            lines.append("**关键内容**:")
-            for h in highlights[:3]:  # Limit to 3 highlights
-                # Clean and truncate highlight
-                h_clean = h.strip().replace("\n", " ")
-                if len(h_clean) > 300:
-                    h_clean = h_clean[:300] + "..."
-                lines.append(f"> {h_clean}")
-            lines.append("")
+        if self.method == "zstd":
+            zstd = _zstd_module()
+            dict_data = zstd.ZstdCompressionDict(zdict, dict_type=zstd.DICT_TYPE_RAWCONTENT) if zdict else None
+            payload = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(raw)
+        else:
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=zdict) if zdict else zlib.compressobj(ZLIB_LEVEL)
+            payload = compressor.compress(raw) + compressor.flush()
+        return f"{self.method} {dict_id} {len(raw)}\n".encode("ascii") + payload
 
-        # Text snippet if no highlights or summary
-        if not highlights and not summary and text:
-            snippet = text[:500].strip().replace("\n", " ")
-            if len(text) > 500:
-                snippet += "..."
-            lines.append(f"**内容预览**: {snippet}")
-            lines.append("")
+    def decode(self, blob: bytes) -> str:
+        """Decompress a blob from encode(); raises ValueError if it cannot be read."""
+        return "".join(self.iter_decode(io.BytesIO(blob)))
 
-        lines.append("---")
-        lines.append("")
+    def iter_decode(self, f: BinaryIO) -> Iterator[str]:
+        """
+        Decompress a blob from a binary file step by step, yielding its text.
 
-    return "\n".join(lines)
+        Callers that only need the start of a page can stop early without
+        decompressing the rest. Raises ValueError if the blob cannot be read.
+        """
+        try:
+            method, dict_id, _ = f.readline().decode("ascii").split(" ")
+            zdict = self._dictionary(dict_id) if dict_id != "-" else b""
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            if method == "zlib":
+                decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+                for chunk in iter(functools.partial(f.read, STREAM_CHUNK_SIZE), b""):
+                    yield decoder.decode(decompressor.decompress(chunk))
+                yield decoder.decode(decompressor.flush(), final=True)
+            elif method == "zstd" and _zstd_module() is not None:
+                zstd = _zstd_module()
+                dict_data = zstd.ZstdCompressionDict(zdict, dict_type=zstd.DICT_TYPE_RAWCONTENT) if zdict else None
+                reader = zstd.ZstdDecompressor(dict_data=dict_data).stream_reader(f)
+                for chunk in iter(functools.partial(reader.read, STREAM_CHUNK_SIZE), b""):
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b"", final=True)
+            else:
+                raise ValueError(f"unsupported codec {method}")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"unreadable text blob: {e}") from e
 
+    @staticmethod
+    def raw_size(blob: bytes) -> int:
+        """Uncompressed size in bytes recorded in a blob header."""
+        return int(blob.partition(b"\n")[0].rsplit(b" ", 1)[-1])
 
-def format_contents_results(results: List[Dict]) -> str:
-    """Format content fetch results as Markdown."""
-    if not results:
-        return "## 内容抓取结果\n\n未获取到内容。"
+    def usage(self) -> Dict[str, int]:
+        """Number and total size of dictionaries and of pending sample files."""
+        dictionaries = [st.st_size for name, st in self._files() if name.endswith(".zdict")]
+        samples = [st.st_size for _, st in self._files("samples")]
+        return {
+            "dictionaries": len(dictionaries),
+            "dictionary_bytes": sum(dictionaries),
+            "sample_domains": len(samples),
+            "sample_bytes": sum(samples),
+        }
 
-    lines = ["## 内容抓取结果", ""]
 
-    for i, item in enumerate(results, 1):
-        title = item.get("title", "无标题")
-        url = item.get("url", "")
-        domain = extract_domain(url)
-        summary = item.get("summary", "")
-        highlights = item.get("highlights", [])
-        text = item.get("text", "")
+_text_codec: Optional[TextCodec] = None
 
-        lines.append(f"### {i}. [{title}]({url})")
-        lines.append(f"**来源**: {domain}")
-        lines.append("")
 
-        if summary:
-            lines.append(f"**摘要**: {summary}")
-            lines.append("")
+def get_text_codec() -> TextCodec:
+    """The process-wide TextCodec."""
+    global _text_codec
+    if _text_codec is None:
+        _text_codec = TextCodec()
+    return _text_codec
 
-        if highlights:
-            lines.append("**关键内容**:")
-            for h in highlights[:5]:
-                h_clean = h.strip().replace("\n", " ")
-                if len(h_clean) > 300:
-                    h_clean = h_clean[:300] + "..."
-                lines.append(f"> {h_clean}")
-            lines.append("")
 
-        if text:
-            # Show more text for contents mode
-            snippet = text[:1000].strip()
-            if len(text) > 1000:
-                snippet += "..."
-            lines.append(f"**内容**:\n```\n{snippet}\n```")
-            lines.append("")
+class PageText:
+    """
+    Page text left in its compressed blob and decoded only as far as it is read.
 
-        lines.append("---")
-        lines.append("")
+    Supports len(), slicing and str(), which is all the contents formatters
+    need, so showing the first thousand characters or one section of a long
+    page does not decompress or hold the rest. Each read that goes past the
+    decoded prefix starts again from the beginning of the blob. Raises
+    ValueError if the blob is gone or unreadable.
+    """
 
-    return "\n".join(lines)
+    def __init__(self, path: str, codec: TextCodec, length: Optional[int] = None):
+        self.path = path
+        self.codec = codec
+        self._length = length
+        self._prefix = ""
+        self._complete = False
 
+    def _read(self, end: Optional[int] = None) -> str:
+        """Decoded text up to at least `end` characters (all of it if None)."""
+        if self._complete or (end is not None and len(self._prefix) >= end):
+            return self._prefix
+        parts = []
+        size = 0
+        try:
+            with open(self.path, "rb") as f:
+                for chunk in self.codec.iter_decode(f):
+                    parts.append(chunk)
+                    size += len(chunk)
+                    if end is not None and size >= end:
+                        break
+                else:
+                    self._complete = True
+        except OSError as e:
+            raise ValueError(f"text blob is gone: {e}") from e
+        self._prefix = "".join(parts)
+        if self._complete:
+            self._length = len(self._prefix)
+        return self._prefix
 
-# ============================================================================
-# Commands
+    def __len__(self) -> int:
+        if self._length is None:
+            try:
+                with open(self.path, "rb") as f:
+                    self._length = sum(len(chunk) for chunk in self.codec.iter_decode(f))
+            except OSError as e:
+                raise ValueError(f"text blob is gone: {e}") from e
+        return self._length
+
+    def __bool__(self) -> bool:
+        return True  # only texts of at least BLOB_MIN_CHARS are stored as blobs
+
+    def __getitem__(self, index: Any) -> str:
+        if isinstance(index, slice):
+            start, stop = index.start or 0, index.stop
+            if index.step is None and start >= 0 and (stop is None or stop >= 0):
+                return self._read(stop)[index]
+        elif isinstance(index, int) and index >= 0:
+            return self._read(index + 1)[index]
+        return str(self)[index]
+
+    def __str__(self) -> str:
+        return self._read()
+
+    def __repr__(self) -> str:
+        return f"PageText({self.path!r}, length={self._length})"
+
+
+# ============================================================================
+# Response Cache
+# ============================================================================
+
+def normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize a request payload so equivalent requests share one cache key.
+
+    Whitespace in the query is collapsed and domain lists are de-duplicated
+    and sorted; everything else (including URL order) is kept verbatim.
+    """
+    normalized = dict(payload)
+
+    if isinstance(normalized.get("query"), str):
+        normalized["query"] = " ".join(normalized["query"].split())
+
+    for field in ("includeDomains", "excludeDomains"):
+        if normalized.get(field):
+            normalized[field] = sorted({d.strip().lower() for d in normalized[field]})
+
+    return normalized
+
+
+EVICT_MARKER = ".evict-check"
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for Exa API responses.
+
+    Entries are keyed on the normalized request payload, expire after a
+    per-entry TTL and are evicted least-recently-used first once the cache
+    grows past ``max_bytes``. Long result texts are stored once per
+    distinct body as compressed blobs, which entries reference by hash and
+    which are evicted like entries.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        ttl: int = CACHE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        codec: Optional[TextCodec] = None,
+    ):
+        self.directory = os.path.join(directory, "responses")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._codec = codec
+
+    @property
+    def codec(self) -> TextCodec:
+        if self._codec is None:
+            self._codec = get_text_codec()
+        return self._codec
+
+    @staticmethod
+    def make_key(endpoint: str, payload: Dict[str, Any]) -> str:
+        """Return the cache key for a request."""
+        blob = json.dumps(
+            {"endpoint": endpoint, "payload": normalize_payload(payload)},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def _put_blob(self, text: str, domain: str) -> Optional[str]:
+        """Store a text body once; returns its hash (None if it could not be written)."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = self._blob_path(digest)
+        try:
+            if os.path.exists(path):
+                os.utime(path, None)
+                return digest
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self.codec.encode(text, domain))
+            os.replace(tmp_path, path)
+        except OSError:
+            return None
+        return digest
+
+    def _pack(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Move long result texts into blobs, leaving {"$blob": hash} behind."""
+        results = response.get("results")
+        if not isinstance(results, list):
+            return response
+        packed = []
+        for item in results:
+            text = item.get("text") if isinstance(item, dict) else None
+            if isinstance(text, str) and len(text) >= BLOB_MIN_CHARS:
+                digest = self._put_blob(text, extract_domain(item.get("url") or ""))
+                if digest is not None:
+                    item = dict(item, text={"$blob": digest, "length": len(text)})
+            packed.append(item)
+        return dict(response, results=packed)
+
+    def _unpack(self, response: Dict[str, Any], lazy: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Inline blob texts again, or reference them as PageText if `lazy`;
+        None if any blob is gone or unreadable.
+        """
+        results = response.get("results")
+        if not isinstance(results, list):
+            return response
+        unpacked = []
+        for item in results:
+            text = item.get("text") if isinstance(item, dict) else None
+            if isinstance(text, dict) and "$blob" in text:
+                path = self._blob_path(text["$blob"])
+                try:
+                    os.utime(path, None)
+                    if lazy:
+                        page = PageText(path, self.codec, text.get("length"))
+                    else:
+                        with open(path, "rb") as f:
+                            page = self.codec.decode(f.read())
+                except (OSError, ValueError):
+                    return None
+                item = dict(item, text=page)
+            unpacked.append(item)
+        return dict(response, results=unpacked)
+
+    def get(self, key: str, lazy: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached response, or None if missing or expired.
+
+        With `lazy`, long texts are PageText references to their blobs.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("stored_at", 0) > entry.get("ttl", self.ttl):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        response = entry.get("response")
+        if isinstance(response, dict):
+            response = self._unpack(response, lazy)
+            if response is None:
+                return None
+
+        # Bump mtime so eviction treats this entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key: str, response: Dict[str, Any], ttl: Optional[int] = None):
+        """Store a response, evicting old entries if a size check is due and the cache is full."""
+        path = self._path(key)
+        entry = {
+            "stored_at": time.time(),
+            "ttl": ttl if ttl is not None else self.ttl,
+            "response": self._pack(response),
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        if self._evict_due():
+            self.evict()
+
+    def _evict_due(self) -> bool:
+        """
+        Whether this write should check the cache size.
+
+        Walking the cache costs a stat per file, so all processes share one
+        check per CACHE_EVICT_INTERVAL, timed by a marker file's mtime.
+        """
+        marker = os.path.join(self.directory, EVICT_MARKER)
+        try:
+            if time.time() - os.stat(marker).st_mtime < CACHE_EVICT_INTERVAL:
+                return False
+        except OSError:
+            pass
+        try:
+            with open(marker, "a"):
+                pass
+            os.utime(marker, None)
+        except OSError:
+            return False
+        return True
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name == EVICT_MARKER:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        # Dictionaries and samples count toward the limit but stay (see TextCodec)
+        usage = self.codec.usage()
+        total += usage["dictionary_bytes"] + usage["sample_bytes"]
+        if total <= self.max_bytes:
+            return
+
+        # Evict down to 90% so writes before the next check still fit
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Sizes of entries and text blobs, and bytes saved by compression and dedupe."""
+        blob_root = os.path.join(self.directory, "blobs")
+        entries = entry_bytes = 0
+        references: Dict[str, int] = {}
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory and "blobs" in dirs:
+                dirs.remove("blobs")
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    entry_bytes += os.path.getsize(path)
+                    with open(path, "r", encoding="utf-8") as f:
+                        results = (json.load(f).get("response") or {}).get("results") or []
+                except (OSError, ValueError, AttributeError):
+                    continue
+                entries += 1
+                for item in results:
+                    text = item.get("text") if isinstance(item, dict) else None
+                    if isinstance(text, dict) and "$blob" in text:
+                        references[text["$blob"]] = references.get(text["$blob"], 0) + 1
+
+        blobs = blob_bytes = text_bytes = dedupe_saved = 0
+        for root, _, files in os.walk(blob_root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    with open(os.path.join(root, name), "rb") as f:
+                        header = f.readline()
+                        size = os.fstat(f.fileno()).st_size
+                    raw = TextCodec.raw_size(header)
+                except (OSError, ValueError):
+                    continue
+                blobs += 1
+                blob_bytes += size
+                text_bytes += raw
+                dedupe_saved += raw * max(0, references.get(name, 0) - 1)
+
+        return {
+            "entries": entries,
+            "entry_bytes": entry_bytes,
+            "blobs": blobs,
+            "blob_bytes": blob_bytes,
+            "text_bytes": text_bytes,
+            "text_references": sum(references.values()),
+            "dedupe_saved_bytes": dedupe_saved,
+        }
+
+
+# ============================================================================
+# Record & Replay
+# ============================================================================
+
+class ReplayMissError(LookupError):
+    """A replayed session has no recorded response for a request."""
+
+
+class SessionRecording:
+    """
+    Request/response pairs saved in a directory (--record / --replay).
+
+    Each pair is one JSON file named by endpoint and the hash of the
+    normalized payload, so fixtures can be checked into a repository and
+    replayed with no network access. Fields derived from the clock are left
+    out of the key, so recordings keep matching on later days.
+    """
+
+    def __init__(self, directory: str, replaying: bool = False):
+        self.directory = directory
+        self.replaying = replaying
+        if not replaying:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(endpoint: str, payload: Dict[str, Any]) -> str:
+        """Return the recording key for a request."""
+        normalized = normalize_payload(payload)
+        for field in RECORD_IGNORED_FIELDS:
+            normalized.pop(field, None)
+        blob = json.dumps(
+            {"endpoint": endpoint, "payload": normalized},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, endpoint: str, payload: Dict[str, Any]) -> str:
+        key = self.make_key(endpoint, payload)
+        return os.path.join(self.directory, f"{endpoint.strip('/')}-{key[:16]}.json")
+
+    def load(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the recorded response; raises ReplayMissError if there is none."""
+        path = self._path(endpoint, payload)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (OSError, ValueError, KeyError):
+            raise ReplayMissError(
+                f"No recorded response for {endpoint} in {self.directory} "
+                f"({os.path.basename(path)}); record it with --record first"
+            ) from None
+
+    def save(self, endpoint: str, payload: Dict[str, Any], response: Dict[str, Any]):
+        """Record a response, replacing an earlier recording of the same request."""
+        path = self._path(endpoint, payload)
+        entry = {"endpoint": endpoint, "payload": payload, "response": response}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"WARN: Could not record {endpoint} response: {e}", file=sys.stderr)
+
+
+# ============================================================================
+# Local Index
+# ============================================================================
+
+_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RE = re.compile(f"([{_CJK_CHARS}])")
+_QUERY_TERM_RE = re.compile(f"[{_CJK_CHARS}]+|[^\\W{_CJK_CHARS}]+")
+
+
+def segment_cjk(text: str) -> str:
+    """Space out CJK characters so the FTS tokenizer indexes each one."""
+    return _CJK_RE.sub(r" \1 ", text)
+
+
+def build_fts_query(query: str, any_term: bool = False) -> Optional[str]:
+    """
+    Turn a free-text query into an FTS5 MATCH expression.
+
+    Latin words become quoted terms and CJK runs become phrases of single
+    characters, matching how segment_cjk() indexed them.
+    """
+    terms = []
+    for term in _QUERY_TERM_RE.findall(query):
+        if _CJK_RE.match(term):
+            term = " ".join(term)
+        terms.append(f'"{term}"')
+    return (" OR " if any_term else " ").join(terms) or None
+
+
+class LocalIndex:
+    """
+    SQLite FTS5 index of every page exa_fetch has retrieved.
+
+    Documents are de-duplicated by content hash and several URLs (mirrors,
+    tracking-parameter variants) may point at one document. A search
+    snippet never replaces a full page already stored for the same URL.
+    Long page text is stored compressed (TextCodec) and the FTS table is
+    contentless, so each page is kept once.
+    """
+
+    VERSION = 1  # PRAGMA user_version; 1 = compressed text, contentless FTS
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL UNIQUE,
+            url TEXT NOT NULL,
+            title TEXT,
+            published_date TEXT,
+            author TEXT,
+            summary TEXT,
+            highlights TEXT,
+            text TEXT,
+            fetched_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY,
+            doc_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS urls_doc_id ON urls (doc_id);
+    """
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE documents_fts
+            USING fts5(title, summary, highlights, text, content = '', tokenize = 'unicode61')
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < self.VERSION:
+            self._migrate()
+
+    def _migrate(self):
+        """Compress stored text and rebuild the FTS table as contentless."""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.VERSION:
+                conn.execute("DROP TABLE IF EXISTS documents_fts")
+                conn.execute(self.FTS_SCHEMA)
+                for row in conn.execute("SELECT * FROM documents").fetchall():
+                    text = self._text(row)
+                    if isinstance(row["text"], str):
+                        conn.execute(
+                            "UPDATE documents SET text = ? WHERE id = ?",
+                            (self._encode_text(text, row["url"]), row["id"]),
+                        )
+                    self._fts("insert", row["id"], row["title"], row["summary"],
+                              json.loads(row["highlights"] or "[]"), text)
+                conn.execute(f"PRAGMA user_version = {self.VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _encode_text(text: str, url: str) -> Any:
+        """Column value for page text: compressed bytes if long, else the text itself."""
+        if len(text) < BLOB_MIN_CHARS:
+            return text
+        return get_text_codec().encode(text, extract_domain(url))
+
+    @staticmethod
+    def _stored_text(row: Any) -> Optional[str]:
+        """Page text of a documents row (None if it cannot be decompressed, e.g. zstd without zstandard)."""
+        value = row["text"]
+        if isinstance(value, bytes):
+            try:
+                return get_text_codec().decode(value)
+            except ValueError:
+                return None
+        return value or ""
+
+    @classmethod
+    def _text(cls, row: Any) -> str:
+        """Page text of a documents row ("" if it cannot be decompressed)."""
+        text = cls._stored_text(row)
+        return "" if text is None else text
+
+    def _fts(
+        self,
+        action: str,
+        doc_id: int,
+        title: Optional[str],
+        summary: Optional[str],
+        highlights: List[str],
+        text: str,
+    ):
+        """Add ("insert") or remove ("delete") a document's terms; contentless FTS needs the old values to delete."""
+        values = (segment_cjk(title or ""), segment_cjk(summary or ""),
+                  segment_cjk("\n".join(highlights)), segment_cjk(text))
+        if action == "delete":
+            self._conn.execute(
+                "INSERT INTO documents_fts (documents_fts, rowid, title, summary, highlights, text)"
+                " VALUES ('delete', ?, ?, ?, ?, ?)",
+                (doc_id, *values),
+            )
+        else:
+            self._conn.execute(
+                "INSERT INTO documents_fts (rowid, title, summary, highlights, text) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, *values),
+            )
+
+    @staticmethod
+    def _document(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Extract the stored fields from an API result (None if it has no content)."""
+        url = item.get("url") or item.get("id")
+        text = item.get("text") or ""
+        summary = item.get("summary") or ""
+        highlights = [h for h in item.get("highlights") or [] if h]
+        if not url or not (text or summary or highlights):
+            return None
+
+        if text:
+            basis = " ".join(text.split())
+        else:
+            basis = "\n".join([item.get("title") or "", summary, *highlights])
+        return {
+            "url": url,
+            "content_hash": hashlib.sha256(basis.encode("utf-8")).hexdigest(),
+            "title": item.get("title") or "",
+            "published_date": item.get("publishedDate"),
+            "author": item.get("author"),
+            "summary": summary,
+            "highlights": highlights,
+            "text": text,
+        }
+
+    def add(self, items: Iterable[Dict[str, Any]]) -> int:
+        """
+        Store API results, de-duplicating by URL and content hash.
+
+        Returns:
+            Number of results that had content to index
+        """
+        docs = [doc for doc in map(self._document, items) if doc is not None]
+        if not docs:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for doc in docs:
+                    self._upsert(doc)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(docs)
+
+    def _upsert(self, doc: Dict[str, Any]):
+        conn = self._conn
+        previous = conn.execute(
+            "SELECT d.* FROM urls u JOIN documents d ON d.id = u.doc_id WHERE u.url = ?",
+            (doc["url"],),
+        ).fetchone()
+        if previous is not None and previous["text"] and not doc["text"]:
+            return
+
+        row = conn.execute(
+            "SELECT * FROM documents WHERE content_hash = ?", (doc["content_hash"],)
+        ).fetchone()
+        stored = None if row is None else self._stored_text(row)
+        if row is not None and stored is None:
+            # Contentless FTS can only delete a document with the exact values it
+            # indexed; without the text, leave the row and its terms as they are
+            doc_id = row["id"]
+        elif row is None:
+            doc_id = conn.execute(
+                "INSERT INTO documents (content_hash, url, title, published_date, author,"
+                " summary, highlights, text, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc["content_hash"], doc["url"], doc["title"], doc["published_date"], doc["author"],
+                 doc["summary"], json.dumps(doc["highlights"], ensure_ascii=False),
+                 self._encode_text(doc["text"], doc["url"]), time.time()),
+            ).lastrowid
+        else:
+            # Same page again: keep whichever title/summary/highlights we have
+            doc_id = row["id"]
+            self._fts("delete", doc_id, row["title"], row["summary"],
+                      json.loads(row["highlights"] or "[]"), stored)
+            doc["title"] = doc["title"] or row["title"] or ""
+            doc["summary"] = doc["summary"] or row["summary"] or ""
+            doc["highlights"] = doc["highlights"] or json.loads(row["highlights"] or "[]")
+            doc["text"] = stored
+            conn.execute(
+                "UPDATE documents SET title = ?, summary = ?, highlights = ?, fetched_at = ? WHERE id = ?",
+                (doc["title"], doc["summary"], json.dumps(doc["highlights"], ensure_ascii=False),
+                 time.time(), doc_id),
+            )
+
+        if row is None or stored is not None:
+            self._fts("insert", doc_id, doc["title"], doc["summary"], doc["highlights"], doc["text"])
+        conn.execute("INSERT OR REPLACE INTO urls (url, doc_id) VALUES (?, ?)", (doc["url"], doc_id))
+
+        if previous is not None and previous["id"] != doc_id:
+            orphan = conn.execute("SELECT 1 FROM urls WHERE doc_id = ?", (previous["id"],)).fetchone()
+            previous_text = self._stored_text(previous)
+            # An undecodable orphan is kept: deleting its terms needs the text
+            if orphan is None and previous_text is not None:
+                conn.execute("DELETE FROM documents WHERE id = ?", (previous["id"],))
+                self._fts("delete", previous["id"], previous["title"], previous["summary"],
+                          json.loads(previous["highlights"] or "[]"), previous_text)
+
+    def _result(self, row: Any, url: Optional[str] = None) -> Dict[str, Any]:
+        """Rebuild an API-shaped result from a documents row."""
+        url = url or row["url"]
+        result = {"id": url, "url": url, "title": row["title"]}
+        for key, column in (("publishedDate", "published_date"), ("author", "author"),
+                            ("summary", "summary")):
+            if row[column]:
+                result[key] = row[column]
+        text = self._text(row)
+        if text:
+            result["text"] = text
+        highlights = json.loads(row["highlights"] or "[]")
+        if highlights:
+            result["highlights"] = highlights
+        return result
+
+    def lookup(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return stored full pages for the given URLs, keyed by URL."""
+        found = {}
+        with self._lock:
+            for url in dict.fromkeys(urls):
+                row = self._conn.execute(
+                    "SELECT d.* FROM urls u JOIN documents d ON d.id = u.doc_id"
+                    " WHERE u.url = ? AND d.text != ''",
+                    (url,),
+                ).fetchone()
+                if row is not None:
+                    found[url] = self._result(row, url)
+        return found
+
+    def search(
+        self,
+        query: str,
+        limit: int = DEFAULT_NUM_RESULTS,
+        include_domains: Optional[List[str]] = None,
+        exclude_domains: Optional[List[str]] = None,
+        start_date: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Full-text search, best match first.
+
+        All query terms must match; if nothing does, any term may match.
+        """
+        include = [d.lower() for d in include_domains or []]
+        exclude = [d.lower() for d in exclude_domains or []]
+
+        def allowed(url: str) -> bool:
+            domain = extract_domain(url).lower()
+            if include and not any(domain == d or domain.endswith("." + d) for d in include):
+                return False
+            return not any(domain == d or domain.endswith("." + d) for d in exclude)
+
+        sql = (
+            "SELECT d.*, bm25(documents_fts, ?, ?, ?, ?) AS rank"
+            " FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid"
+            " WHERE documents_fts MATCH ? AND (? IS NULL OR d.published_date >= ?)"
+            " ORDER BY rank LIMIT ?"
+        )
+        # Over-fetch so domain filtering still leaves enough results
+        fetch = limit * 5 if include or exclude else limit
+        for any_term in (False, True):
+            expression = build_fts_query(query, any_term)
+            if expression is None:
+                return []
+            with self._lock:
+                rows = self._conn.execute(
+                    sql, (*INDEX_FIELD_WEIGHTS, expression, start_date, start_date, fetch),
+                ).fetchall()
+            results = []
+            for row in rows:
+                if allowed(row["url"]):
+                    result = self._result(row)
+                    result["score"] = round(-row["rank"], 4)
+                    results.append(result)
+            if results:
+                return results[:limit]
+        return []
+
+    def stats(self) -> Dict[str, Any]:
+        """Document count, database size and stored vs. raw text bytes."""
+        documents = text_bytes = stored_bytes = 0
+        with self._lock:
+            for (value,) in self._conn.execute("SELECT text FROM documents"):
+                documents += 1
+                if isinstance(value, bytes):
+                    stored_bytes += len(value)
+                    text_bytes += TextCodec.raw_size(value)
+                elif value:
+                    size = len(value.encode("utf-8"))
+                    stored_bytes += size
+                    text_bytes += size
+        file_bytes = 0
+        for suffix in ("", "-wal"):
+            try:
+                file_bytes += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "documents": documents,
+            "file_bytes": file_bytes,
+            "text_bytes": text_bytes,
+            "stored_text_bytes": stored_bytes,
+        }
+
+
+_local_index: Optional[LocalIndex] = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """Return the process-wide local index, or None if disabled or unavailable."""
+    global _local_index
+    if not INDEX_ENABLED:
+        return None
+    with _local_index_lock:
+        if _local_index is None:
+            try:
+                _local_index = LocalIndex()
+            except (sqlite3.Error, OSError) as e:
+                print(f"WARN: Local index unavailable: {e}", file=sys.stderr)
+                return None
+        return _local_index
+
+
+# ============================================================================
+# HTTP Session
+# ============================================================================
+
+@functools.lru_cache(maxsize=None)
+def keep_alive_adapter_class() -> type:
+    """
+    Return KeepAliveAdapter, defining it on first use.
+
+    The class subclasses requests' HTTPAdapter, so it is created lazily
+    to avoid importing requests at startup. Its pools time connection
+    setup for the profiler.
+    """
+
+    class TimedHTTPConnection(urllib3.connection.HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                note_connect(time.perf_counter() - start)
+
+    class TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                note_connect(time.perf_counter() - start)
+
+    class TimedHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class KeepAliveAdapter(requests.adapters.HTTPAdapter):
+        """HTTPAdapter that enables TCP keep-alive on pooled connections."""
+
+        def __init__(self, keep_alive: bool = True, **kwargs):
+            self.keep_alive = keep_alive
+            super().__init__(**kwargs)
+
+        def init_poolmanager(self, *args, **kwargs):
+            if self.keep_alive:
+                options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                           (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+                kwargs["socket_options"] = options
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": TimedHTTPConnectionPool,
+                "https": TimedHTTPSConnectionPool,
+            }
+
+    return KeepAliveAdapter
+
+
+def create_session(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    keep_alive: bool = True,
+) -> requests.Session:
+    """
+    Create a requests Session with a sized connection pool.
+
+    Args:
+        pool_size: Maximum pooled connections per host
+        keep_alive: Reuse connections between requests (HTTP and TCP keep-alive)
+    """
+    session = requests.Session()
+    adapter = keep_alive_adapter_class()(
+        keep_alive=keep_alive,
+        pool_connections=1,
+        pool_maxsize=pool_size,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+_shared_session: Optional[requests.Session] = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+# ============================================================================
+# Profiling
+# ============================================================================
+
+PHASE_LABELS = {
+    "setup": "客户端初始化",
+    "cache": "缓存读写",
+    "index": "本地索引写入",
+    "wait": "限流/重试等待",
+    "connect": "连接 (DNS/TCP/TLS)",
+    "ttfb": "首字节 (TTFB)",
+    "download": "下载",
+    "decode": "JSON 解码",
+    "format": "格式化输出",
+}
+
+_phase_local = threading.local()
+
+
+def note_connect(seconds: float):
+    """Credit connection setup time to the request running on this thread."""
+    _phase_local.connect = getattr(_phase_local, "connect", 0.0) + seconds
+
+
+def take_connect_time() -> float:
+    """Return and reset this thread's accumulated connection setup time."""
+    seconds = getattr(_phase_local, "connect", 0.0)
+    _phase_local.connect = 0.0
+    return seconds
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class Profiler:
+    """
+    Per-phase timings and sizes for one command (--profile / --metrics-file).
+
+    Phase times are summed over all requests, so with concurrent requests
+    they can add up to more than the command's wall time.
+    """
+
+    def __init__(self, command: Optional[str], meta: Optional[Dict[str, Any]] = None):
+        self.command = command
+        self.meta = dict(meta or {})
+        self.phases = dict.fromkeys(PHASE_LABELS, 0.0)
+        self.requests: List[Dict[str, Any]] = []
+        self.cache_hits = 0
+        self.response_bytes = 0
+        self.output_bytes = 0
+        self.total: Optional[float] = None
+        self.exit_code: Optional[int] = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float, size: int = 0):
+        with self._lock:
+            self.phases[phase] += seconds
+            self.response_bytes += size
+
+    def add_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def add_request(
+        self,
+        endpoint: str,
+        status: Any,
+        connect: float,
+        ttfb: float,
+        download: float = 0.0,
+        size: Optional[int] = None,
+    ):
+        """Record one HTTP attempt (size is None while a body is still streaming)."""
+        with self._lock:
+            self.phases["connect"] += connect
+            self.phases["ttfb"] += ttfb
+            self.phases["download"] += download
+            self.response_bytes += size or 0
+            self.requests.append({
+                "endpoint": endpoint,
+                "status": status,
+                "connect_ms": _ms(connect),
+                "ttfb_ms": _ms(ttfb),
+                "download_ms": _ms(download),
+                "bytes": size,
+            })
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time a block, excluding time other phases record meanwhile (e.g. streamed downloads)."""
+        before = sum(self.phases.values())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(name, max(0.0, elapsed - (sum(self.phases.values()) - before)))
+
+    def timed_download(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Wrap a streamed body, crediting each read to the download phase."""
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.add("download", time.perf_counter() - start)
+                return
+            self.add("download", time.perf_counter() - start, len(chunk))
+            yield chunk
+
+    def timed_decode(self, events: Iterable[Any]) -> Iterator[Any]:
+        """Wrap an incremental parser, crediting its own work to the decode phase."""
+        iterator = iter(events)
+        while True:
+            with self.phase("decode"):
+                try:
+                    event = next(iterator)
+                except StopIteration:
+                    return
+            yield event
+
+    def finish(self, exit_code: Optional[int]):
+        self.total = time.perf_counter() - self._started
+        self.exit_code = exit_code
+
+    def to_record(self) -> Dict[str, Any]:
+        """Structured record for the metrics file."""
+        return {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "command": self.command,
+            **self.meta,
+            "exit": self.exit_code,
+            "total_ms": _ms(self.total or 0.0),
+            "phases_ms": {name: _ms(seconds) for name, seconds in self.phases.items()},
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "response_bytes": self.response_bytes,
+            "output_bytes": self.output_bytes,
+        }
+
+    def format_summary(self) -> str:
+        """Human-readable breakdown for --profile."""
+        total = self.total or 0.0
+        lines = [f"[性能分析: {self.command}]", f"  {total * 1000:>9.1f} ms  总耗时"]
+        for name, label in PHASE_LABELS.items():
+            lines.append(f"  {self.phases[name] * 1000:>9.1f} ms  {label}")
+        other = max(0.0, total - sum(self.phases.values()))
+        lines.append(f"  {other * 1000:>9.1f} ms  其他")
+        for r in self.requests:
+            size = "-" if r["bytes"] is None else f"{r['bytes'] / 1024:.1f} KB"
+            lines.append(
+                f"  POST {r['endpoint']} {r['status']}: 连接 {r['connect_ms']:.1f} ms, "
+                f"首字节 {r['ttfb_ms']:.1f} ms, 下载 {r['download_ms']:.1f} ms, {size}"
+            )
+        lines.append(
+            f"  请求 {len(self.requests)} 次, 缓存命中 {self.cache_hits}, "
+            f"响应 {self.response_bytes / 1024:.1f} KB, 输出 {self.output_bytes / 1024:.1f} KB"
+        )
+        return "\n".join(lines)
+
+    def append_to(self, path: str):
+        """Append this command's record as one JSON line."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_record(), ensure_ascii=False) + "\n")
+
+
+class _CountingWriter:
+    """Pass-through text stream that counts the UTF-8 bytes written."""
+
+    def __init__(self, stream: Any, profiler: Profiler):
+        self._stream = stream
+        self._profiler = profiler
+
+    def write(self, data: str) -> int:
+        self._profiler.output_bytes += len(data.encode("utf-8"))
+        return self._stream.write(data)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+# ============================================================================
+# Rate Limiting & Retries
+# ============================================================================
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens now and return how long the caller must wait before
+        using them. Never blocks, so it also serves asyncio callers.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until tokens are available."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back every caller for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent traffic.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one,
+    so a burst of failures cannot multiply load on an already struggling API.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_retries: int = 3, max_tokens: int = 20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_MAX_DELAY) + random.uniform(0, RETRY_BASE_DELAY))
+    return delay
+
+
+_rate_limiter = TokenBucket(RATE_LIMIT, RATE_BURST)
+_retry_budget = RetryBudget()
+
+
+def update_json_file(path: str, update):
+    """
+    Apply `update(state)` to a JSON file under an exclusive lock and return its result.
+
+    The lock is flock() where available; elsewhere concurrent updates may
+    occasionally be lost, which only costs accuracy.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as f:
+            try:
+                state = json.load(f)
+            except ValueError:
+                state = {}
+            result = update(state)
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+        return result
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class ProcessCoordinator:
+    """
+    Lock-file coordination between exa_fetch processes on one machine.
+
+    A token bucket stored in a flock()-protected state file caps the
+    machine-wide request rate, and a per-request lock file lets identical
+    in-flight requests share one upstream call: the first process fetches,
+    the others wait on its lock and read the result it leaves behind.
+    POSIX only.
+    """
+
+    def __init__(
+        self,
+        directory: str = os.path.join(CACHE_DIR, "coord"),
+        rate: float = GLOBAL_RATE_LIMIT,
+        burst: int = RATE_BURST,
+    ):
+        import fcntl
+        self._fcntl = fcntl
+        self.directory = directory
+        self.rate = rate
+        self.burst = max(1, burst)
+        os.makedirs(os.path.join(directory, "inflight"), exist_ok=True)
+        self._state_path = os.path.join(directory, "rate.json")
+
+    def _update_state(self, update) -> float:
+        """Apply `update(state, now) -> wait` to the shared state under an exclusive lock."""
+        return update_json_file(self._state_path, lambda state: update(state, time.time()))
+
+    def reserve(self) -> float:
+        """Take one machine-wide request slot and return the seconds to wait for it."""
+        if self.rate <= 0:
+            return 0.0
+
+        def take(state: Dict[str, Any], now: float) -> float:
+            tokens = state.get("tokens", float(self.burst))
+            updated = state.get("updated", now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - 1
+            state["tokens"] = tokens
+            state["updated"] = now
+            wait = max(0.0, -tokens / self.rate)
+            return max(wait, state.get("paused_until", 0.0) - now)
+
+        return self._update_state(take)
+
+    def acquire(self):
+        """Block until a machine-wide request slot is available."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back every process for `seconds` (e.g. after a 429)."""
+        def hold(state: Dict[str, Any], now: float) -> float:
+            state["paused_until"] = max(state.get("paused_until", 0.0), now + seconds)
+            return 0.0
+
+        self._update_state(hold)
+
+    def run_coalesced(self, key: str, fetch) -> Dict[str, Any]:
+        """
+        Run `fetch()` unless another process is already making the same request.
+
+        If the request is in flight elsewhere, wait for it and return its
+        result; if that process fails, fetch ourselves.
+        """
+        lock_path = os.path.join(self.directory, "inflight", f"{key}.lock")
+        result_path = os.path.join(self.directory, "inflight", f"{key}.json")
+        started = time.time()
+        fd: Optional[int] = None
+
+        def try_lock() -> bool:
+            nonlocal fd
+            if fd is None:
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            if not self._try_lock(fd):
+                return False
+            if self._is_current(fd, lock_path):
+                return True
+            # Cleaned up while we waited: lock the file that replaced it
+            os.close(fd)
+            fd = None
+            return try_lock()
+
+        try:
+            locked = try_lock()
+            if not locked:
+                print("[合并请求: 等待其他进程的相同请求]", file=sys.stderr)
+                deadline = time.monotonic() + COALESCE_WAIT
+                while not locked and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    locked = try_lock()
+                data = self._read_result(result_path, since=started)
+                if data is not None:
+                    return data
+
+            data = fetch()
+            self._write_result(result_path, data)
+            return data
+        finally:
+            if fd is not None:
+                os.close(fd)  # releases the lock
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _is_current(fd: int, path: str) -> bool:
+        """Whether `fd` is still the file at `path` (not unlinked and replaced)."""
+        try:
+            opened, current = os.fstat(fd), os.stat(path)
+        except OSError:
+            return False
+        return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+    @staticmethod
+    def _read_result(path: str, since: float) -> Optional[Dict[str, Any]]:
+        """Read a result written after `since`, i.e. by the request we waited on."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("stored_at", 0) < since:
+            return None
+        return entry.get("response")
+
+    def _write_result(self, path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": time.time(), "response": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        self._cleanup()
+
+    def _cleanup(self, max_age: float = 600):
+        """Remove results and lock files nobody is waiting on any more."""
+        inflight = os.path.join(self.directory, "inflight")
+        cutoff = time.time() - max_age
+        try:
+            names = os.listdir(inflight)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(inflight, name)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+                if name.endswith(".lock"):
+                    self._remove_lock(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_lock(self, path: str):
+        """Unlink a stale lock file, but only while holding it ourselves."""
+        fd = os.open(path, os.O_RDWR)
+        try:
+            if self._try_lock(fd) and self._is_current(fd, path):
+                os.remove(path)
+        finally:
+            os.close(fd)
+
+
+def get_coordinator() -> Optional[ProcessCoordinator]:
+    """Return a ProcessCoordinator, or None where flock() is unavailable."""
+    try:
+        return ProcessCoordinator()
+    except (ImportError, OSError) as e:
+        print(f"WARN: Cross-process coordination unavailable: {e}", file=sys.stderr)
+        return None
+
+
+# ============================================================================
+# Hedged Requests
+# ============================================================================
+
+class RequestHedger:
+    """
+    When to back up a slow request, and with what (--hedge).
+
+    Recent latencies per endpoint and search type, plus the hedge budget,
+    live in a JSON file shared by all processes (see update_json_file), so
+    short CLI runs learn from each other. Every request deposits ``ratio``
+    tokens and every hedge spends one, keeping the extra load near
+    ``ratio`` of traffic. File errors just disable hedging for the request.
+    """
+
+    def __init__(
+        self,
+        mode: str = "duplicate",
+        path: str = LATENCY_HISTORY,
+        percentile: float = HEDGE_PERCENTILE,
+        ratio: float = HEDGE_BUDGET_RATIO,
+    ):
+        self.mode = mode
+        self.path = path
+        self.percentile = percentile
+        self.ratio = ratio
+
+    @staticmethod
+    def latency_key(endpoint: str, payload: Dict[str, Any]) -> str:
+        """History bucket: search type for /search, URL count for /contents."""
+        if endpoint == "/search":
+            return f"/search:{payload.get('type', '')}"
+        if endpoint == "/contents":
+            return f"/contents:{len(payload.get('urls') or payload.get('ids') or ())}"
+        return endpoint
+
+    def begin(self, key: str) -> Optional[float]:
+        """
+        Count a request against the budget and pick its hedge delay.
+
+        Returns:
+            Seconds to wait before hedging, or None without enough history
+        """
+        def deposit(state: Dict[str, Any]) -> List[float]:
+            tokens = state.get("tokens", 1.0) + self.ratio
+            state["tokens"] = round(min(HEDGE_MAX_TOKENS, tokens), 3)
+            return list(state.get("latency", {}).get(key, ()))
+
+        try:
+            samples = update_json_file(self.path, deposit)
+        except OSError:
+            return None
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(HEDGE_MIN_DELAY, ordered[min(index, len(ordered) - 1)])
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget."""
+        def spend(state: Dict[str, Any]) -> bool:
+            if state.get("tokens", 0) < 1:
+                return False
+            state["tokens"] = round(state["tokens"] - 1, 3)
+            return True
+
+        try:
+            return update_json_file(self.path, spend)
+        except OSError:
+            return False
+
+    def observe(self, key: str, seconds: float):
+        """Add one successful request's latency to the history."""
+        def add(state: Dict[str, Any]):
+            samples = state.setdefault("latency", {}).setdefault(key, [])
+            samples.append(round(seconds, 3))
+            del samples[:-LATENCY_WINDOW]
+
+        try:
+            update_json_file(self.path, add)
+        except OSError:
+            pass
+
+    def backup_payload(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """The hedge request: a fast search in "fast" mode, otherwise the same request."""
+        if self.mode == "fast" and endpoint == "/search" and payload.get("type") != "fast":
+            return {**payload, "type": "fast"}
+        return payload
+
+
+# ============================================================================
+# API Client
+# ============================================================================
+
+def build_search_payload(
+    query: str,
+    search_type: str = DEFAULT_SEARCH_TYPE,
+    num_results: int = DEFAULT_NUM_RESULTS,
+    category: Optional[str] = None,
+    include_domains: Optional[List[str]] = None,
+    exclude_domains: Optional[List[str]] = None,
+    start_published_date: Optional[str] = None,
+    contents: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Build the /search request body."""
+    payload = {
+        "query": query,
+        "type": search_type,
+        "numResults": num_results,
+    }
+
+    if category:
+        payload["category"] = category
+    if include_domains:
+        payload["includeDomains"] = include_domains
+    if exclude_domains:
+        payload["excludeDomains"] = exclude_domains
+    if start_published_date:
+        payload["startPublishedDate"] = start_published_date
+    if contents:
+        payload["contents"] = contents
+
+    return payload
+
+
+def build_contents_payload(
+    urls: List[str],
+    text: bool = True,
+    highlights: Optional[Dict[str, Any]] = None,
+    summary: Optional[Dict[str, Any]] = None,
+    livecrawl: str = "fallback",
+) -> Dict[str, Any]:
+    """Build the /contents request body."""
+    payload = {
+        "urls": urls,
+        "livecrawl": livecrawl,
+    }
+
+    if text:
+        payload["text"] = True
+    if highlights:
+        payload["highlights"] = highlights
+    if summary:
+        payload["summary"] = summary
+
+    return payload
+
+
+def contents_options(
+    highlights: bool = True,
+    summary: bool = True,
+    livecrawl: str = "fallback",
+) -> Dict[str, Any]:
+    """get_contents() options used by the `contents` command (and --prefetch)."""
+    return {
+        "text": True,
+        "highlights": {"numSentences": 3, "highlightsPerUrl": 5} if highlights else None,
+        "summary": {"query": "Summarize the main points"} if summary else None,
+        "livecrawl": livecrawl,
+    }
+
+
+def match_requested(items: Iterable[Dict[str, Any]], urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Map /contents results back to the URLs that were requested.
+
+    Exa echoes the requested URL as the result id; the url field may be
+    the page it redirected to.
+    """
+    requested = set(urls)
+    matched: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        for field in ("id", "url"):
+            if item.get(field) in requested:
+                matched.setdefault(item[field], item)
+                break
+    return matched
+
+
+class JSONStreamParser:
+    """
+    Incremental parser for a top-level JSON object arriving in chunks.
+
+    Iterating yields ("item", value) for each element of ``array_key`` as
+    soon as that element is complete, and ("field", (key, value)) for every
+    other top-level member, so results can be used before the body ends.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], array_key: str = "results"):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.array_key = array_key
+
+    def _fill(self) -> bool:
+        """Read the next chunk into the buffer; False once the body is exhausted."""
+        if self._eof:
+            return False
+        # Drop the consumed prefix so the buffer stays about one item long
+        if self._pos > 65536:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self._buf += text
+                return True
+        self._buf += self._utf8.decode(b"", final=True)
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON response")
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON response, got {found!r}")
+        self._pos += 1
+
+    def _decode_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by a chunk boundary decodes too early; only
+            # trust a value once a delimiter (or the end of input) follows it
+            if (end == len(self._buf) or self._buf[end] not in ",]} \t\r\n") and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(":")
+            if key == self.array_key and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield "item", self._decode_value()
+                        sep = self._peek()
+                        self._pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise ValueError(f"Expected ',' or ']' in JSON response, got {sep!r}")
+            else:
+                yield "field", (key, self._decode_value())
+
+            sep = self._peek()
+            self._pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or '}}' in JSON response, got {sep!r}")
+
+
+class _BaseExaClient:
+    """Request bookkeeping shared by the sync and async clients."""
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[ResponseCache] = None,
+        refresh: bool = False,
+        coordinator: Optional[ProcessCoordinator] = None,
+        profiler: Optional[Profiler] = None,
+        index: Optional[LocalIndex] = None,
+        recording: Optional[SessionRecording] = None,
+    ):
+        self.api_key = api_key
+        self.headers = {
+            "x-api-key": api_key,
+            "Content-Type": "application/json"
+        }
+        self.cache = cache
+        self.refresh = refresh
+        self.max_retries = MAX_RETRIES
+        self.rate_limiter = _rate_limiter
+        self.retry_budget = _retry_budget
+        self.coordinator = coordinator
+        self.profiler = profiler
+        self.index = index
+        self.recording = recording
+
+    def _replay(self, endpoint: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The recorded response when replaying (raises ReplayMissError if missing), else None."""
+        if self.recording is None or not self.recording.replaying:
+            return None
+        return self.recording.load(endpoint, payload)
+
+    def _record(self, endpoint: str, payload: Dict[str, Any], data: Dict[str, Any]):
+        """Save a response when recording."""
+        if self.recording is not None and not self.recording.replaying:
+            self.recording.save(endpoint, payload, data)
+
+    def _cache_lookup(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Look a request up in the cache.
+
+        Returns:
+            Tuple of (cache key or None if caching is off, cached response or None)
+        """
+        if self.cache is None:
+            return None, None
+
+        key = self.cache.make_key(endpoint, payload)
+        if not self.refresh:
+            if self.profiler is None:
+                cached = self.cache.get(key)
+            else:
+                with self.profiler.phase("cache"):
+                    cached = self.cache.get(key)
+            if cached is not None:
+                print(f"[缓存命中: {endpoint}]", file=sys.stderr)
+                if self.profiler is not None:
+                    self.profiler.add_cache_hit()
+                return key, cached
+        print(f"[缓存未命中: {endpoint}]", file=sys.stderr)
+        return key, None
+
+    def _cache_store(self, key: Optional[str], data: Dict[str, Any], cache_ttl: Optional[int]):
+        """Store a fresh response if caching is on."""
+        if key is None:
+            return
+        if self.profiler is None:
+            self.cache.put(key, data, ttl=cache_ttl)
+        else:
+            with self.profiler.phase("cache"):
+                self.cache.put(key, data, ttl=cache_ttl)
+
+    def _index_results(self, results: List[Dict[str, Any]]):
+        """Add fresh results to the local index; failures only warn."""
+        if self.index is None or not results:
+            return
+        try:
+            if self.profiler is None:
+                self.index.add(results)
+            else:
+                with self.profiler.phase("index"):
+                    self.index.add(results)
+        except sqlite3.Error as e:
+            print(f"WARN: Local index update failed: {e}", file=sys.stderr)
+
+    def _page_cache_keys(self, urls: List[str], options: Dict[str, Any]) -> Dict[str, str]:
+        """Cache key of a single-URL /contents request for each URL (empty if caching is off)."""
+        if self.cache is None:
+            return {}
+        options = {name: value for name, value in options.items() if name != "cache_ttl"}
+        return {
+            url: self.cache.make_key("/contents", build_contents_payload([url], **options))
+            for url in urls
+        }
+
+    def _retry_delay(
+        self,
+        endpoint: str,
+        attempt: int,
+        reason: str,
+        retry_after: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        Decide whether a failed attempt should be retried.
+
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        if attempt >= self.max_retries or not self.retry_budget.try_spend():
+            return None
+        if retry_after is not None:
+            # The server asked everyone to slow down, not just this request
+            self.rate_limiter.pause(retry_after)
+            if self.coordinator is not None:
+                self.coordinator.pause(retry_after)
+        delay = backoff_delay(attempt, retry_after)
+        print(
+            f"[重试 {endpoint} {attempt + 1}/{self.max_retries}: {reason}, {delay:.1f}s 后]",
+            file=sys.stderr,
+        )
+        return delay
+
+
+class ExaClient(_BaseExaClient):
+    """
+    Minimal Exa API client.
+
+    By default all clients in a process share one pooled keep-alive session.
+    Pass ``pool_size`` to give the client its own pool, or ``session`` to
+    reuse an existing one. Use as a context manager to close an owned pool.
+    With a ``recording``, responses are saved to or replayed from disk.
+    With a ``hedger``, slow non-streaming requests are backed up by a second
+    one and the first response wins.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[ResponseCache] = None,
+        refresh: bool = False,
+        session: Optional[requests.Session] = None,
+        pool_size: Optional[int] = None,
+        coordinator: Optional[ProcessCoordinator] = None,
+        profiler: Optional[Profiler] = None,
+        index: Optional[LocalIndex] = None,
+        recording: Optional[SessionRecording] = None,
+        hedger: Optional[RequestHedger] = None,
+    ):
+        super().__init__(
+            api_key, cache=cache, refresh=refresh, coordinator=coordinator,
+            profiler=profiler, index=index, recording=recording,
+        )
+        self.hedger = hedger
+
+        self._session = session
+        self._pool_size = pool_size
+        self._session_lock = threading.Lock()
+        self._served = threading.local()
+        self._owns_session = session is None and pool_size is not None
+
+    @property
+    def session(self) -> requests.Session:
+        """The connection pool, created on first request so cache and index hits skip it."""
+        with self._session_lock:
+            if self._session is None:
+                if self._pool_size is not None:
+                    self._session = create_session(self._pool_size)
+                else:
+                    self._session = get_shared_session()
+            return self._session
+
+    def close(self):
+        """Close the connection pool if this client owns it."""
+        if self._owns_session and self._session is not None:
+            self._session.close()
+
+    def __enter__(self) -> "ExaClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _post(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """POST to the API, serving from and filling the cache if enabled."""
+        self._served.locally = True
+        replayed = self._replay(endpoint, payload)
+        if replayed is not None:
+            return replayed
+
+        key, cached = self._cache_lookup(endpoint, payload)
+        if cached is not None:
+            self._record(endpoint, payload, cached)
+            return cached
+
+        self._served.locally = False
+        if self.coordinator is not None:
+            data = self.coordinator.run_coalesced(
+                key or ResponseCache.make_key(endpoint, payload),
+                lambda: self._request(endpoint, payload),
+            )
+        else:
+            data = self._request(endpoint, payload)
+
+        # A fast stand-in must not be cached or recorded as the requested search type
+        if not data.pop(HEDGE_FALLBACK_FIELD, False):
+            self._record(endpoint, payload, data)
+            self._cache_store(key, data, cache_ttl)
+        self._index_results(data.get("results", []))
+        return data
+
+    def served_locally(self) -> bool:
+        """Whether this thread's last search/contents call was answered from the cache or a replay."""
+        return getattr(self._served, "locally", False)
+
+    def _request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST and decode the JSON response, hedged if a hedger is set."""
+        if self.hedger is not None:
+            return self._hedged_request(endpoint, payload)
+        return self._request_once(endpoint, payload)
+
+    def _hedged_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a request and back it up if it outlives the hedge delay.
+
+        Each attempt runs on a daemon thread; the first success is returned
+        and the slower attempt is left to finish, only feeding the latency
+        history. Raises the first error if every attempt fails.
+        """
+        hedger = self.hedger
+        outcomes = queue.Queue()
+
+        def attempt(body: Dict[str, Any], backup: bool):
+            key = hedger.latency_key(endpoint, body)
+            start = time.perf_counter()
+            try:
+                data = self._request_once(endpoint, body)
+            except Exception as e:
+                outcomes.put((backup, None, e))
+                return
+            hedger.observe(key, time.perf_counter() - start)
+            if body is not payload:
+                data[HEDGE_FALLBACK_FIELD] = True
+            outcomes.put((backup, data, None))
+
+        delay = hedger.begin(hedger.latency_key(endpoint, payload))
+        threading.Thread(target=attempt, args=(payload, False), daemon=True).start()
+        attempts = 1
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except queue.Empty:
+            backup_payload = hedger.backup_payload(endpoint, payload)
+            if hedger.try_spend():
+                label = "发起 fast 备用请求" if backup_payload is not payload else "发起重复请求"
+                print(f"[对冲: {endpoint} {delay:.1f}s 未返回, {label}]", file=sys.stderr)
+                threading.Thread(target=attempt, args=(backup_payload, True), daemon=True).start()
+                attempts += 1
+            outcome = outcomes.get()
+
+        error = None
+        for _ in range(attempts):
+            backup, data, exc = outcome or outcomes.get()
+            outcome = None
+            if exc is None:
+                if backup:
+                    print("[对冲: 备用请求先返回]", file=sys.stderr)
+                return data
+            error = error or exc
+        raise error
+
+    def _request_once(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST and decode the JSON response."""
+        response = self._send(endpoint, payload)
+        if self.profiler is None:
+            return response.json()
+        with self.profiler.phase("decode"):
+            return response.json()
+
+    def _send(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        stream: bool = False,
+    ) -> requests.Response:
+        """POST with rate limiting and retries on 429/5xx and network errors."""
+        self.retry_budget.record_request()
+        profiler = self.profiler
+        if profiler is None:
+            session = self.session
+        else:
+            # The first request imports requests and builds the pool: setup, not transfer
+            with profiler.phase("setup"):
+                session = self.session
+        attempt = 0
+        while True:
+            waited = time.perf_counter()
+            self.rate_limiter.acquire()
+            if self.coordinator is not None:
+                self.coordinator.acquire()
+            if profiler is not None:
+                profiler.add("wait", time.perf_counter() - waited)
+            take_connect_time()
+
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                response = session.post(
+                    f"{BASE_URL}{endpoint}",
+                    json=payload,
+                    headers=self.headers,
+                    timeout=DEFAULT_TIMEOUT,
+                    stream=stream,
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                reason = type(e).__name__
+                if profiler is not None:
+                    connect = take_connect_time()
+                    elapsed = time.perf_counter() - start
+                    profiler.add_request(endpoint, reason, connect, max(0.0, elapsed - connect))
+            else:
+                if profiler is not None:
+                    self._profile_response(endpoint, response, time.perf_counter() - start, stream)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = None
+                reason = f"HTTP {response.status_code}"
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.close()
+
+            delay = self._retry_delay(endpoint, attempt, reason, retry_after)
+            if delay is None:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+            time.sleep(delay)
+            if profiler is not None:
+                profiler.add("wait", delay)
+            attempt += 1
+
+    def _profile_response(
+        self,
+        endpoint: str,
+        response: requests.Response,
+        elapsed: float,
+        stream: bool,
+    ):
+        """
+        Split one attempt into connect / TTFB / download.
+
+        requests sets ``elapsed`` once the headers are parsed; without
+        streaming the body has been read by the time post() returns.
+        """
+        connect = take_connect_time()
+        headers_at = response.elapsed.total_seconds()
+        ttfb = max(0.0, headers_at - connect)
+        if stream:
+            self.profiler.add_request(endpoint, response.status_code, connect, ttfb)
+        else:
+            download = max(0.0, elapsed - headers_at)
+            self.profiler.add_request(
+                endpoint, response.status_code, connect, ttfb, download, len(response.content),
+            )
+
+    def search(
+        self,
+        query: str,
+        search_type: str = DEFAULT_SEARCH_TYPE,
+        num_results: int = DEFAULT_NUM_RESULTS,
+        category: Optional[str] = None,
+        include_domains: Optional[List[str]] = None,
+        exclude_domains: Optional[List[str]] = None,
+        start_published_date: Optional[str] = None,
+        contents: Optional[Dict[str, Any]] = None,
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Execute search with optional content fetching."""
+        payload = build_search_payload(
+            query, search_type, num_results, category, include_domains,
+            exclude_domains, start_published_date, contents,
+        )
+        return self._post("/search", payload, cache_ttl=cache_ttl)
+
+    def search_stream(
+        self,
+        query: str,
+        search_type: str = DEFAULT_SEARCH_TYPE,
+        num_results: int = DEFAULT_NUM_RESULTS,
+        category: Optional[str] = None,
+        include_domains: Optional[List[str]] = None,
+        exclude_domains: Optional[List[str]] = None,
+        start_published_date: Optional[str] = None,
+        contents: Optional[Dict[str, Any]] = None,
+        cache_ttl: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Like search(), but yield each result as soon as it has been parsed
+        from the response body instead of waiting for the whole document.
+        """
+        payload = build_search_payload(
+            query, search_type, num_results, category, include_domains,
+            exclude_domains, start_published_date, contents,
+        )
+        replayed = self._replay("/search", payload)
+        if replayed is not None:
+            yield from replayed.get("results", [])
+            return
+
+        key, cached = self._cache_lookup("/search", payload)
+        if cached is not None:
+            self._record("/search", payload, cached)
+            yield from cached.get("results", [])
+            return
+
+        response = self._send("/search", payload, stream=True)
+        # Only keep the full document around if it is going into the cache, index or a recording
+        keep = key is not None or self.index is not None or self.recording is not None
+        data: Optional[Dict[str, Any]] = {"results": []} if keep else None
+        try:
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if self.profiler is None:
+                events = JSONStreamParser(chunks, array_key="results")
+            else:
+                chunks = self.profiler.timed_download(chunks)
+                events = self.profiler.timed_decode(JSONStreamParser(chunks, array_key="results"))
+            for kind, value in events:
+                if kind == "item":
+                    if data is not None:
+                        data["results"].append(value)
+                    yield value
+                elif data is not None:
+                    data[value[0]] = value[1]
+        finally:
+            response.close()
+
+        if data is not None:
+            self._record("/search", payload, data)
+            self._cache_store(key, data, cache_ttl)
+            self._index_results(data["results"])
+
+    def get_contents(
+        self,
+        urls: List[str],
+        text: bool = True,
+        highlights: Optional[Dict[str, Any]] = None,
+        summary: Optional[Dict[str, Any]] = None,
+        livecrawl: str = "fallback",
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Fetch content from URLs."""
+        payload = build_contents_payload(urls, text, highlights, summary, livecrawl)
+        return self._post("/contents", payload, cache_ttl=cache_ttl)
+
+    def get_contents_chunked(
+        self,
+        urls: List[str],
+        chunk_size: int = DEFAULT_CONTENTS_CHUNK_SIZE,
+        max_workers: int = DEFAULT_CONTENTS_WORKERS,
+        lazy_text: bool = False,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """
+        Fetch content for many URLs as parallel /contents requests.
+
+        Args:
+            urls: URLs to fetch (duplicates are fetched once)
+            chunk_size: Maximum URLs per request
+            max_workers: Maximum requests in flight
+            lazy_text: Return long texts as PageText references into the
+                cache instead of strings (needs the cache; see PageText)
+            **kwargs: Passed through to get_contents()
+
+        Returns:
+            {"results": [...], "errors": {url: reason}} with results in the
+            original URL order. A failed chunk only fails its own URLs.
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        by_url: Dict[str, Dict[str, Any]] = {}
+        errors: Dict[str, str] = {}
+
+        # Pages are also cached one by one, so overlapping and prefetched
+        # requests are served without refetching
+        page_keys = self._page_cache_keys(unique_urls, kwargs)
+        if page_keys and not self.refresh:
+            with self.profiler.phase("cache") if self.profiler is not None else contextlib.nullcontext():
+                for url, key in page_keys.items():
+                    cached = self.cache.get(key, lazy=lazy_text)
+                    if cached and cached.get("results"):
+                        by_url[url] = cached["results"][0]
+            if by_url:
+                print(f"[缓存命中: /contents {len(by_url)}/{len(unique_urls)} 个 URL]", file=sys.stderr)
+                if self.profiler is not None:
+                    for _ in by_url:
+                        self.profiler.add_cache_hit()
+
+        pending = [url for url in unique_urls if url not in by_url]
+        chunk_size = max(1, chunk_size)
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+
+        def fetch(chunk: List[str]) -> Dict[str, Any]:
+            return self.get_contents(urls=chunk, **kwargs)
+
+        workers = max(1, min(max_workers, len(chunks) or 1))
+        with concurrent_futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch, chunk) for chunk in chunks]
+            for i, chunk in enumerate(chunks):
+                future, futures[i] = futures[i], None
+                try:
+                    result = future.result()
+                except requests.exceptions.HTTPError as e:
+                    errors.update((url, f"API request failed: {e}") for url in chunk)
+                    continue
+                except requests.exceptions.Timeout:
+                    errors.update((url, "Request timeout") for url in chunk)
+                    continue
+                except Exception as e:
+                    errors.update((url, str(e)) for url in chunk)
+                    continue
+
+                requested = set(chunk)
+                for url, item in match_requested(result.get("results", []), chunk).items():
+                    by_url[url] = item
+                    if len(chunk) > 1 and url in page_keys:
+                        self._cache_store(page_keys[url], {
+                            "results": [item],
+                            "statuses": [{"id": url, "status": "success"}],
+                        }, kwargs.get("cache_ttl"))
+                if lazy_text:
+                    # Swap the fetched texts for references to their cached blobs
+                    # so only one chunk's pages are in memory at a time
+                    for url in chunk:
+                        cached = self.cache.get(page_keys[url], lazy=True) if url in page_keys else None
+                        if url in by_url and cached and cached.get("results"):
+                            by_url[url] = cached["results"][0]
+                for status in result.get("statuses", []):
+                    url = status.get("id") or status.get("url")
+                    if url in requested and status.get("status") not in (None, "success"):
+                        error = status.get("error") or {}
+                        reason = error.get("tag") if isinstance(error, dict) else error
+                        errors[url] = str(reason or status.get("status"))
+
+        results = []
+        for url in unique_urls:
+            if url in by_url:
+                results.append(by_url[url])
+            else:
+                errors.setdefault(url, "no content returned")
+
+        return {
+            "results": results,
+            "errors": {url: errors[url] for url in unique_urls if url in errors},
+        }
+
+
+class AsyncExaClient(_BaseExaClient):
+    """
+    asyncio Exa API client with bounded concurrency.
+
+    Mirrors ExaClient.search/get_contents as coroutines; at most
+    ``max_concurrency`` requests are in flight at once. Uses httpx when it
+    is installed, otherwise runs the shared requests pool in the default
+    executor (still bounded by the semaphore). Cache, index, recording and
+    coordinator I/O also runs in the executor, off the event loop. A
+    coordinator only applies its machine-wide rate limit here; request
+    coalescing and hedging are sync-only.
+
+    Example:
+        async with AsyncExaClient(API_KEY) as client:
+            results = await asyncio.gather(*(client.search(q) for q in queries))
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[ResponseCache] = None,
+        refresh: bool = False,
+        max_concurrency: int = DEFAULT_ASYNC_CONCURRENCY,
+        pool_size: Optional[int] = None,
+        coordinator: Optional[ProcessCoordinator] = None,
+        recording: Optional[SessionRecording] = None,
+    ):
+        super().__init__(
+            api_key, cache=cache, refresh=refresh, coordinator=coordinator, recording=recording,
+        )
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size or max(max_concurrency, DEFAULT_POOL_SIZE)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._http = None
+
+        try:
+            import httpx
+        except ImportError:
+            self._httpx = None
+            # Cache is handled here, so the fallback client runs uncached
+            self._sync_client = ExaClient(
+                api_key, pool_size=self.pool_size, coordinator=coordinator
+            )
+        else:
+            self._httpx = httpx
+
+    def _ensure_started(self):
+        # Created lazily so they bind to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._http is None and self._httpx is not None:
+            limits = self._httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            )
+            self._http = self._httpx.AsyncClient(
+                headers=self.headers,
+                limits=limits,
+                timeout=DEFAULT_TIMEOUT,
+            )
+
+    async def aclose(self):
+        """Close the underlying connection pool."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._httpx is None:
+            self._sync_client.close()
+
+    async def __aenter__(self) -> "AsyncExaClient":
+        self._ensure_started()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def _post(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """POST to the API, serving from and filling the cache if enabled."""
+        replayed = await self._blocking(self._replay, endpoint, payload)
+        if replayed is not None:
+            return replayed
+
+        key, cached = await self._blocking(self._cache_lookup, endpoint, payload)
+        if cached is not None:
+            await self._blocking(self._record, endpoint, payload, cached)
+            return cached
+
+        self._ensure_started()
+        async with self._semaphore:
+            if self._http is not None:
+                data = await self._request(endpoint, payload)
+            else:
+                data = await self._blocking(self._sync_client._request, endpoint, payload)
+
+        await self._blocking(self._store, endpoint, payload, key, data, cache_ttl)
+        return data
+
+    def _store(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        key: Optional[str],
+        data: Dict[str, Any],
+        cache_ttl: Optional[int],
+    ):
+        """Record, cache and index a fresh response."""
+        self._record(endpoint, payload, data)
+        self._cache_store(key, data, cache_ttl)
+        self._index_results(data.get("results", []))
+
+    @staticmethod
+    async def _blocking(func, *args: Any) -> Any:
+        """Run blocking local I/O (files, SQLite, flock) in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    def _requests_error(self, error: Exception) -> Exception:
+        """The requests exception ExaClient raises for an httpx transport error."""
+        if isinstance(error, self._httpx.TimeoutException):
+            return requests.exceptions.Timeout(str(error))
+        return requests.exceptions.ConnectionError(str(error))
+
+    async def _request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """httpx counterpart of ExaClient._request(), raising the same exception types."""
+        httpx = self._httpx
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve()
+            if self.coordinator is not None:
+                wait = max(wait, await self._blocking(self.coordinator.reserve))
+            if wait > 0:
+                await asyncio.sleep(wait)
+            retry_after = None
+            try:
+                response = await self._http.post(f"{BASE_URL}{endpoint}", json=payload)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error = e
+                reason = type(e).__name__
+            else:
+                error = None
+                reason = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            delay = self._retry_delay(endpoint, attempt, reason, retry_after)
+            if delay is None:
+                if error is not None:
+                    raise self._requests_error(error) from error
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if response.status_code >= 400:
+            # Same exception type as the sync client
+            raise requests.exceptions.HTTPError(
+                f"{response.status_code} Error: {response.reason_phrase} "
+                f"for url: {response.url}"
+            )
+        return response.json()
+
+    async def search(
+        self,
+        query: str,
+        search_type: str = DEFAULT_SEARCH_TYPE,
+        num_results: int = DEFAULT_NUM_RESULTS,
+        category: Optional[str] = None,
+        include_domains: Optional[List[str]] = None,
+        exclude_domains: Optional[List[str]] = None,
+        start_published_date: Optional[str] = None,
+        contents: Optional[Dict[str, Any]] = None,
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Execute search with optional content fetching."""
+        payload = build_search_payload(
+            query, search_type, num_results, category, include_domains,
+            exclude_domains, start_published_date, contents,
+        )
+        return await self._post("/search", payload, cache_ttl=cache_ttl)
+
+    async def get_contents(
+        self,
+        urls: List[str],
+        text: bool = True,
+        highlights: Optional[Dict[str, Any]] = None,
+        summary: Optional[Dict[str, Any]] = None,
+        livecrawl: str = "fallback",
+        cache_ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Fetch content from URLs."""
+        payload = build_contents_payload(urls, text, highlights, summary, livecrawl)
+        return await self._post("/contents", payload, cache_ttl=cache_ttl)
+
+
+# ============================================================================
+# Output Formatting
+# ============================================================================
+
+def extract_domain(url: str) -> str:
+    """Extract domain from URL."""
+    try:
+        parsed = urlparse(url)
+        return parsed.netloc or url
+    except Exception:
+        return url
+
+
+def format_date(date_str: Optional[str]) -> str:
+    """Format date string for display."""
+    if not date_str:
+        return "N/A"
+    try:
+        # Handle ISO format
+        if "T" in date_str:
+            dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+            return dt.strftime("%Y-%m-%d")
+        return date_str[:10]  # YYYY-MM-DD
+    except Exception:
+        return date_str[:10] if len(date_str) >= 10 else date_str
+
+
+def format_omitted(omitted: int) -> str:
+    """Markdown notice for results left out by --max-output-tokens."""
+    return f"*输出预算不足，省略了 {omitted} 条结果*\n"
+
+
+def iter_search_results(results: Iterable[Dict], query: str, omitted: int = 0) -> Iterator[str]:
+    """
+    Format search results as Markdown, one block at a time.
+
+    Yields the header and then one block per result as soon as that result
+    is available; joining the blocks with newlines gives the full document.
+    `omitted` results dropped by an output budget are noted at the end.
+    """
+    results = iter(results)
+    first = next(results, None)
+    if first is None:
+        empty = format_omitted(omitted) if omitted else "未找到相关结果。"
+        yield f"## 搜索结果: \"{query}\"\n\n{empty}"
+        return
+
+    yield "\n".join([f"## 搜索结果: \"{query}\"", ""])
+
+    for i, item in enumerate(itertools.chain([first], results), 1):
+        lines = []
+        title = item.get("title", "无标题")
+        url = item.get("url", "")
+        domain = extract_domain(url)
+        date = format_date(item.get("publishedDate"))
+        summary = item.get("summary", "")
+        highlights = item.get("highlights", [])
+        text = item.get("text", "")
+
+        lines.append(f"### {i}. [{title}]({url})")
+        lines.append(f"**来源**: {domain} | **日期**: {date}")
+        lines.append("")
+
+        # Summary
+        if summary:
+            lines.append(f"**摘要**: {summary}")
+            lines.append("")
+
+        # Highlights (already trimmed to fit when an output budget applies)
+        budgeted = item.get("_budgeted", False)
+        if highlights:
+            lines.append("**关键内容**:")
+            for h in highlights[:None if budgeted else SEARCH_HIGHLIGHTS]:
+                # Clean and truncate highlight
+                h_clean = h.strip().replace("\n", " ")
+                if not budgeted and len(h_clean) > HIGHLIGHT_CHARS:
+                    h_clean = h_clean[:HIGHLIGHT_CHARS] + "..."
+                lines.append(f"> {h_clean}")
+            lines.append("")
+
+        # Text snippet if no highlights or summary, or if the budget left room
+        if budgeted and text:
+            snippet = text.strip().replace("\n", " ")
+            if item["_text_total_length"] > len(text):
+                snippet += "..."
+            lines.append(f"**内容预览**: {snippet}")
+            lines.append("")
+        elif not highlights and not summary and text:
+            snippet = text[:SEARCH_PREVIEW_CHARS].strip().replace("\n", " ")
+            if len(text) > SEARCH_PREVIEW_CHARS:
+                snippet += "..."
+            lines.append(f"**内容预览**: {snippet}")
+            lines.append("")
+
+        lines.append("---")
+        lines.append("")
+        yield "\n".join(lines)
+    if omitted:
+        yield format_omitted(omitted)
+
+
+def format_search_results(results: List[Dict], query: str) -> str:
+    """Format search results as Markdown."""
+    return "\n".join(iter_search_results(results, query))
+
+
+def iter_contents_results(results: Iterable[Dict], omitted: int = 0) -> Iterator[str]:
+    """Format content fetch results as Markdown, one block at a time."""
+    results = iter(results)
+    first = next(results, None)
+    if first is None:
+        empty = format_omitted(omitted) if omitted else "未获取到内容。"
+        yield f"## 内容抓取结果\n\n{empty}"
+        return
+
+    yield "\n".join(["## 内容抓取结果", ""])
+
+    for i, item in enumerate(itertools.chain([first], results), 1):
+        lines = []
+        title = item.get("title", "无标题")
+        url = item.get("url", "")
+        domain = extract_domain(url)
+        summary = item.get("summary", "")
+        highlights = item.get("highlights", [])
+        text = item.get("text", "")
+
+        lines.append(f"### {i}. [{title}]({url})")
+        lines.append(f"**来源**: {domain}")
+        lines.append("")
+
+        if summary:
+            lines.append(f"**摘要**: {summary}")
+            lines.append("")
+
+        budgeted = item.get("_budgeted", False)
+        if highlights:
+            lines.append("**关键内容**:")
+            for h in highlights[:None if budgeted else CONTENTS_HIGHLIGHTS]:
+                h_clean = h.strip().replace("\n", " ")
+                if not budgeted and len(h_clean) > HIGHLIGHT_CHARS:
+                    h_clean = h_clean[:HIGHLIGHT_CHARS] + "..."
+                lines.append(f"> {h_clean}")
+            lines.append("")
+
+        if text:
+            # Show more text for contents mode
+            label = "**内容**"
+            offset = item.get("_text_offset")
+            more = None
+            if budgeted or offset is not None:
+                total = item["_text_total_length"]
+                snippet = text if offset is not None else text.strip()
+                end = (offset or 0) + len(text)
+                if offset is not None:
+                    label += f" (字符 {offset}-{end} / 共 {total})"
+                if total > end:
+                    if offset is None:
+                        snippet += "..."
+                    more = end
+            else:
+                snippet = text[:CONTENTS_PREVIEW_CHARS].strip()
+                if len(text) > CONTENTS_PREVIEW_CHARS:
+                    snippet += "..."
+                    more = CONTENTS_PREVIEW_CHARS
+            lines.append(f"{label}:\n```\n{snippet}\n```")
+            if more is not None:
+                lines.append(f"*共 {item.get('_text_total_length', len(text))} 字符，继续阅读: --range {more}*")
+            lines.append("")
+
+        lines.append("---")
+        lines.append("")
+        yield "\n".join(lines)
+    if omitted:
+        yield format_omitted(omitted)
+
+
+def format_contents_results(results: List[Dict]) -> str:
+    """Format content fetch results as Markdown."""
+    return "\n".join(iter_contents_results(results))
+
+
+def result_to_record(item: Dict[str, Any], rank: int, text_chars: int) -> Dict[str, Any]:
+    """
+    Convert an API result into the stable machine-readable record.
+
+    ``text`` holds at most ``text_chars`` characters starting at
+    ``text_offset``; ``text_total_length`` is the length of the full page.
+    """
+    url = item.get("url", "")
+    text = item.get("text") or ""
+    if item.get("_budgeted") or "_text_offset" in item:
+        snippet = text
+        total_length = item["_text_total_length"]
+    else:
+        snippet = text[:text_chars]
+        total_length = len(text)
+    return {
+        "rank": rank,
+        "title": item.get("title") or "",
+        "url": url,
+        "domain": extract_domain(url),
+        "date": format_date(item.get("publishedDate")) if item.get("publishedDate") else None,
+        "author": item.get("author") or None,
+        "score": item.get("score"),
+        "summary": item.get("summary") or None,
+        "highlights": [h.strip() for h in item.get("highlights") or []],
+        "text": snippet,
+        "text_offset": item.get("_text_offset", 0),
+        "text_length": len(snippet),
+        "text_total_length": total_length,
+    }
+
+
+def iter_records(results: Iterable[Dict], text_chars: int) -> Iterator[Dict[str, Any]]:
+    """Yield machine-readable records for results, ranked from 1."""
+    for rank, item in enumerate(results, 1):
+        yield result_to_record(item, rank, text_chars)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 ASCII characters per token, ~1 per CJK/other character."""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Return the longest prefix of `text` estimated to fit in `tokens`."""
+    if tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= tokens:
+        return text
+    lo, hi = 0, min(len(text), tokens * 4)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def result_relevance(item: Dict[str, Any]) -> Optional[float]:
+    """Relevance signal for a result: Exa's score, else mean highlight score."""
+    if isinstance(item.get("score"), (int, float)):
+        return float(item["score"])
+    scores = [s for s in item.get("highlightScores") or [] if isinstance(s, (int, float))]
+    return sum(scores) / len(scores) if scores else None
+
+
+def allocate_output_budget(
+    results: List[Dict],
+    max_tokens: int,
+    fmt: str = "markdown",
+) -> List[Optional[int]]:
+    """
+    Split an output token budget across results.
+
+    Every kept result first gets its fixed cost (title, URL, labels) plus a
+    minimal content reserve; the rest is shared by weight = rank decay x
+    relevance, and any share a result cannot use (its content is shorter)
+    is handed to the others.
+    Low-ranked results whose fixed cost no longer fits are dropped.
+
+    Returns:
+        Per-result content budgets in tokens (None = drop the result)
+    """
+    overhead = RESULT_OVERHEAD_TOKENS.get(fmt, RESULT_OVERHEAD_TOKENS["markdown"])
+    available = int(max_tokens * BUDGET_SAFETY) - DOCUMENT_OVERHEAD_TOKENS
+
+    # Each kept result gets room for at least one short section, so a tight
+    # budget yields fewer useful results rather than many bare titles
+    reserve = MIN_SECTION_TOKENS + SECTION_OVERHEAD_TOKENS
+    fixed = []
+    for item in results:
+        cost = overhead + estimate_tokens(item.get("title") or "") + estimate_tokens(item.get("url") or "")
+        if sum(fixed) + cost + reserve > available:
+            break
+        fixed.append(cost)
+    kept = len(fixed)
+
+    # Normalize relevance to [0.5, 1] so it tilts but never zeroes a share
+    relevance = [result_relevance(item) for item in results[:kept]]
+    known = [r for r in relevance if r is not None]
+    lo, hi = (min(known), max(known)) if known else (0.0, 0.0)
+    weights = []
+    for rank, rel in enumerate(relevance, 1):
+        norm = (rel - lo) / (hi - lo) if rel is not None and hi > lo else 0.5
+        weights.append((0.5 + 0.5 * norm) / rank ** 0.5)
+
+    natural = []
+    for item in results[:kept]:
+        size = estimate_tokens(item.get("summary") or "")
+        size += sum(estimate_tokens(h) + 3 for h in item.get("highlights") or [])
+        size += estimate_tokens(item.get("text") or "")
+        natural.append(size + 3 * SECTION_OVERHEAD_TOKENS)
+
+    # Water-filling: saturate results that need less than their share
+    extra = [min(reserve, n) for n in natural]
+    remaining = available - sum(fixed) - sum(extra)
+    active = set(range(kept))
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        shares = {i: remaining * weights[i] / total_weight for i in active}
+        saturated = [i for i in active if natural[i] - extra[i] <= shares[i]]
+        if not saturated:
+            for i in active:
+                extra[i] += int(shares[i])
+            break
+        for i in saturated:
+            remaining -= natural[i] - extra[i]
+            extra[i] = natural[i]
+            active.discard(i)
+
+    return extra + [None] * (len(results) - kept)
+
+
+def fit_result(item: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    """
+    Trim a result's summary, highlights and text (in that priority order)
+    to fit `budget` tokens. The returned copy is marked so formatters show
+    everything that is left instead of applying their fixed cutoffs.
+    """
+    text = item.get("text") or ""
+    fitted = dict(item)
+    fitted["_budgeted"] = True
+    fitted["_text_total_length"] = item.get("_text_total_length", len(text))
+    remaining = budget
+
+    summary = item.get("summary") or ""
+    fitted["summary"] = ""
+    if summary and remaining >= MIN_SECTION_TOKENS + SECTION_OVERHEAD_TOKENS:
+        remaining -= SECTION_OVERHEAD_TOKENS
+        cut = truncate_to_tokens(summary, remaining)
+        remaining -= estimate_tokens(cut) + 1
+        fitted["summary"] = cut if cut == summary else cut + "..."
+
+    highlights = []
+    if item.get("highlights") and remaining >= MIN_SECTION_TOKENS + SECTION_OVERHEAD_TOKENS:
+        remaining -= SECTION_OVERHEAD_TOKENS
+        for h in item["highlights"]:
+            if remaining < MIN_SECTION_TOKENS:
+                break
+            h = h.strip()
+            cut = truncate_to_tokens(h, remaining - 3)
+            remaining -= estimate_tokens(cut) + 3
+            highlights.append(cut if cut == h else cut + "...")
+    fitted["highlights"] = highlights
+
+    fitted["text"] = ""
+    if text and remaining >= MIN_SECTION_TOKENS + SECTION_OVERHEAD_TOKENS:
+        fitted["text"] = truncate_to_tokens(text, remaining - SECTION_OVERHEAD_TOKENS - 1)
+    return fitted
+
+
+def apply_output_budget(
+    results: Iterable[Dict],
+    max_tokens: int,
+    fmt: str = "markdown",
+    render: Optional[Callable[[List[Dict]], str]] = None,
+) -> List[Dict]:
+    """
+    Fit results into `max_tokens`, dropping the ones that don't fit at all.
+
+    The allocation works from per-result estimates. With `render` (fitted
+    results -> the exact output), the output is measured and the budget
+    tightened by the overshoot until it really fits.
+    """
+    results = list(results)
+    target = max_tokens
+    while True:
+        budgets = allocate_output_budget(results, target, fmt)
+        fitted = [fit_result(item, budget) for item, budget in zip(results, budgets) if budget is not None]
+        if render is None or not fitted:
+            return fitted
+        used = estimate_tokens(render(fitted))
+        if used <= max_tokens:
+            return fitted
+        target -= used - max_tokens
+
+
+def iter_output(
+    results: Iterable[Dict],
+    fmt: str,
+    kind: str = "search",
+    query: Optional[str] = None,
+    command: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    errors: Optional[Dict[str, str]] = None,
+    omitted: int = 0,
+) -> Iterator[str]:
+    """
+    Render results in `fmt`, one newline-terminated chunk at a time.
+
+    The chunks concatenate to exactly what emit_results prints, so the
+    output budget can measure the real output.
+    """
+    text_chars = SEARCH_PREVIEW_CHARS if kind == "search" else CONTENTS_PREVIEW_CHARS
+
+    if fmt == "jsonl":
+        extra = {"query": query} if query is not None else {}
+        for record in iter_records(results, text_chars):
+            yield json.dumps({**extra, **record}, ensure_ascii=False) + "\n"
+        for url, reason in (errors or {}).items():
+            yield json.dumps({**extra, "url": url, "error": reason}, ensure_ascii=False) + "\n"
+        if omitted:
+            yield json.dumps({**extra, "omitted": omitted}, ensure_ascii=False) + "\n"
+        return
+
+    if fmt == "json":
+        document = {
+            "schema": OUTPUT_SCHEMA,
+            "command": command,
+            "query": query,
+        }
+        document.update(meta or {})
+        document["results"] = list(iter_records(results, text_chars))
+        document["errors"] = errors or {}
+        if omitted:
+            document["omitted"] = omitted
+        yield json.dumps(document, ensure_ascii=False, indent=2) + "\n"
+        return
+
+    if kind == "search":
+        blocks = iter_search_results(results, query or "", omitted)
+    else:
+        blocks = iter_contents_results(results, omitted)
+    for block in blocks:
+        yield block + "\n"
+    if errors:
+        yield format_contents_errors(errors) + "\n"
+
+
+def format_contents_errors(errors: Dict[str, str]) -> str:
+    """Format per-URL fetch failures as Markdown."""
+    lines = ["## 抓取失败", ""]
+    for url, reason in errors.items():
+        lines.append(f"- {url}: {reason}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+# ============================================================================
+# Prefetch
 # ============================================================================
 
-def cmd_search(args: argparse.Namespace) -> int:
-    """Execute search command."""
-    client = ExaClient(API_KEY)
+class PrefetchLedger:
+    """
+    Daily count of prefetched pages, shared by all exa_fetch processes.
+
+    Prefetch may use at most ``share`` of ``quota`` units per calendar day
+    (one unit per page). The count lives in a small JSON file (see
+    update_json_file).
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(CACHE_DIR, "prefetch.json"),
+        quota: int = DAILY_QUOTA,
+        share: float = PREFETCH_SHARE,
+    ):
+        self.path = path
+        self.limit = max(0, int(quota * share))
+
+    def reserve(self, count: int) -> Tuple[int, int]:
+        """
+        Take up to `count` units from today's prefetch budget.
+
+        Returns:
+            Tuple of (units granted, units left today)
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        def take(state: Dict[str, Any]) -> Tuple[int, int]:
+            if state.get("day") != today:
+                state.clear()
+                state.update(day=today, used=0)
+            granted = max(0, min(count, self.limit - state["used"]))
+            state["used"] += granted
+            return granted, self.limit - state["used"]
+
+        return update_json_file(self.path, take)
+
+
+def prefetch_contents(client: ExaClient, urls: List[str]):
+    """
+    Fetch contents for `urls` in a detached background process (--prefetch).
+
+    The child runs the plain `contents` command one URL per request, so it
+    fills exactly the cache entries a later `contents` call looks up. URLs
+    already cached are skipped and the rest are charged to PrefetchLedger.
+    """
+    if client.recording is not None:
+        return  # the background fetch would be neither recorded nor replayed
+    if client.cache is None:
+        print("WARN: --prefetch needs the response cache, skipped", file=sys.stderr)
+        return
+    keys = client._page_cache_keys([url for url in urls if url], contents_options())
+    urls = [url for url, key in keys.items() if client.cache.get(key) is None]
+    if not urls:
+        return
+
+    try:
+        granted, remaining = PrefetchLedger().reserve(len(urls))
+    except OSError as e:
+        print(f"WARN: Could not update prefetch budget: {e}", file=sys.stderr)
+        return
+    if not granted:
+        print("[预取跳过: 今日预取额度已用完]", file=sys.stderr)
+        return
+
+    import subprocess
+    argv = [sys.executable, os.path.abspath(__file__), "contents", *urls[:granted], "--chunk-size", "1"]
+    if client.coordinator is not None:
+        argv.append("--coordinate")  # a foreground `contents` on the same URL waits for us
+    try:
+        subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            env=dict(os.environ, EXA_NO_DAEMON="1"),
+        )
+    except OSError as e:
+        print(f"WARN: Could not start prefetch: {e}", file=sys.stderr)
+        return
+    print(f"[预取: 后台抓取 {granted} 个 URL, 今日额度剩余 {remaining}]", file=sys.stderr)
+
+
+# ============================================================================
+# Result Merging
+# ============================================================================
+
+_SHINGLE_TOKEN_RE = re.compile(f"[{_CJK_CHARS}]|[^\\W{_CJK_CHARS}]+")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalize a URL for deduplication.
+
+    Lowercases scheme and host, drops the fragment, default ports and
+    tracking parameters (utm_*, fbclid, ..., plus per-site ones such as
+    YouTube's si) and sorts the rest. Paths keep
+    their case; a trailing slash is dropped.
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return url
+    if not parsed.netloc:
+        return url
+    scheme = parsed.scheme.lower()
+    host = parsed.netloc.lower()
+    if (scheme, host.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        host = host.rsplit(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    tracking = TRACKING_PARAMS.union(*(
+        names for domain, names in HOST_TRACKING_PARAMS.items()
+        if host == domain or host.endswith("." + domain)
+    ))
+    params = sorted(
+        (key, value)
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in tracking
+    )
+    path = parsed.path.rstrip("/")
+    return urlunparse((scheme, host, path, parsed.params, urlencode(params), ""))
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash over word 3-shingles (single characters for CJK)."""
+    tokens = _SHINGLE_TOKEN_RE.findall(text.lower())
+    shingles = {" ".join(tokens[i:i + 3]) for i in range(max(1, len(tokens) - 2))}
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for s in shingles
+    ]
+    # Column-wise bit counts: bit i is set when most shingles have it set
+    half = len(hashes) / 2
+    bits = "".join("1" if column.count("1") > half else "0" for column in zip(*hashes))
+    return int(bits, 2) if bits else 0
+
+
+def fuse_rankings(rankings: List[List[Dict]], k: int = MERGE_RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge per-query result lists by canonical URL with reciprocal rank fusion.
+
+    Returns:
+        Entries {"url", "result", "score", "queries"} sorted by fused score;
+        "result" is the best-ranked copy and "queries" the indexes of the
+        queries that returned it
+    """
+    fused = {}  # type: Dict[str, Dict[str, Any]]
+    for query_index, results in enumerate(rankings):
+        for rank, item in enumerate(results, 1):
+            url = canonical_url(item.get("url", ""))
+            entry = fused.get(url)
+            if entry is None:
+                entry = fused[url] = {"url": url, "result": item, "score": 0.0, "queries": []}
+            elif query_index in entry["queries"]:
+                continue  # same page twice in one ranking counts once
+            entry["score"] += 1.0 / (k + rank)
+            entry["queries"].append(query_index)
+    return sorted(fused.values(), key=lambda entry: -entry["score"])
+
+
+def _match_terms(query: str) -> List[str]:
+    """Lowercased query words; CJK runs become overlapping character pairs."""
+    terms = []
+    for term in _QUERY_TERM_RE.findall(query.lower()):
+        if _CJK_RE.match(term) and len(term) > 2:
+            terms.extend(term[i:i + 2] for i in range(len(term) - 1))
+        else:
+            terms.append(term)
+    return list(dict.fromkeys(terms))
+
+
+def rank_candidates(
+    results: List[Dict],
+    query: str,
+    top: int,
+    prefer_domains: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Pick the top results of a contents-free search without fetching pages.
+
+    Scores each candidate by its search position, the share of query terms
+    in its title and URL, a preferred-domain bonus and recency; results
+    published before start_date are dropped and repeated domains are
+    penalized so the picks stay diverse.
+
+    Returns:
+        Up to `top` results, best first, with "score" set to the local score
+    """
+    terms = _match_terms(query)
+    prefer = [d.lower() for d in prefer_domains or []]
+    now = datetime.now()
+    scored = []
+    for position, item in enumerate(results):
+        published = (item.get("publishedDate") or "")[:10]
+        if start_date and published and published < start_date[:10]:
+            continue
+        haystack = f"{item.get('title') or ''} {item.get('url', '')}".lower()
+        score = 1.0 / (1 + position)
+        if terms:
+            score += sum(1 for term in terms if term in haystack) / len(terms)
+        domain = extract_domain(item.get("url", "")).lower()
+        if any(domain == d or domain.endswith("." + d) for d in prefer):
+            score += 0.5
+        if published:
+            try:
+                age_days = (now - datetime.strptime(published, "%Y-%m-%d")).days
+                score += 0.25 * max(0.0, 1 - age_days / 365)
+            except ValueError:
+                pass
+        scored.append((score, domain, item))
+
+    picked = []
+    seen_domains = {}  # type: Dict[str, int]
+    while scored and len(picked) < top:
+        best = max(scored, key=lambda c: c[0] - 0.5 * seen_domains.get(c[1], 0))
+        scored.remove(best)
+        score, domain, item = best
+        seen_domains[domain] = seen_domains.get(domain, 0) + 1
+        picked.append(dict(item, score=round(score, 4)))
+    return picked
+
+
+def drop_near_duplicates(results: List[Dict], max_bits: int = NEAR_DUP_BITS) -> Tuple[List[Dict], int]:
+    """
+    Drop results whose text is a near-duplicate of a higher-ranked one.
+
+    Returns:
+        Tuple of (kept results in order, number dropped)
+    """
+    kept = []
+    seen = []  # type: List[int]
+    for item in results:
+        text = item.get("text") or ""
+        if text:
+            fingerprint = simhash(text)
+            if any(bin(fingerprint ^ other).count("1") <= max_bits for other in seen):
+                continue
+            seen.append(fingerprint)
+        kept.append(item)
+    return kept, len(results) - len(kept)
+
+
+# ============================================================================
+# Adaptive Search Type
+# ============================================================================
+
+def search_quality(results: List[Dict], query: str, num_results: int) -> float:
+    """
+    Cheap 0-1 quality proxy for one search: how many results came back and
+    how many query terms the top results mention in their title, URL,
+    summary or highlights.
+    """
+    if not results:
+        return 0.0
+    coverage = min(1.0, len(results) / max(1, num_results))
+    terms = _match_terms(query)
+    if not terms:
+        return round(coverage, 3)
+    matches = []
+    for item in results[:5]:
+        haystack = " ".join([
+            item.get("title") or "", item.get("url") or "", item.get("summary") or "",
+            *(item.get("highlights") or []),
+        ]).lower()
+        matches.append(sum(1 for term in terms if term in haystack) / len(terms))
+    return round(0.4 * coverage + 0.6 * sum(matches) / len(matches), 3)
+
+
+def result_overlap(first: List[Dict], second: List[Dict], top: int = 5) -> float:
+    """Share of the top results two searches have in common, by canonical URL."""
+    a = {canonical_url(item.get("url", "")) for item in first[:top]}
+    b = {canonical_url(item.get("url", "")) for item in second[:top]}
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+class SearchTypeStats:
+    """
+    Running per-intent averages for each search type, shared by all
+    processes through a JSON file: API latency, the search_quality proxy
+    (``quality``, over ``n`` searches) and the result_overlap with the next
+    type up (``overlap``, over ``n_overlap`` escalations).
+    """
+
+    def __init__(self, path: str = SEARCH_TYPE_STATS):
+        self.path = path
+
+    def load(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(
+        self,
+        intent: str,
+        search_type: str,
+        latency_ms: Optional[float] = None,
+        quality: Optional[float] = None,
+        overlap: Optional[float] = None,
+    ):
+        """Fold the observed values (None = not observed) into the running averages; failures only warn."""
+        def fold(state: Dict[str, Any]):
+            entry = state.setdefault(intent, {}).setdefault(search_type, {"n": 0})
+            for field, value in (("latency_ms", latency_ms), ("quality", quality), ("overlap", overlap)):
+                if value is None:
+                    continue
+                old = entry.get(field)
+                entry[field] = round(value if old is None else old + ADAPTIVE_DECAY * (value - old), 3)
+            if quality is not None:
+                entry["n"] += 1
+            if overlap is not None:
+                entry["n_overlap"] = entry.get("n_overlap", 0) + 1
+
+        try:
+            update_json_file(self.path, fold)
+        except OSError as e:
+            print(f"WARN: Could not update search type stats: {e}", file=sys.stderr)
+
+
+def adaptive_search(
+    client: ExaClient,
+    search_kwargs: Dict[str, Any],
+    intent: str,
+    stats: Optional[SearchTypeStats] = None,
+) -> Tuple[str, List[Dict]]:
+    """
+    Try search types from cheapest up to the intent's own type and stop at
+    the first one whose results are good enough.
+
+    A type is good enough if this search's quality proxy reaches
+    ADAPTIVE_QUALITY or its learned overlap for the intent reaches
+    ADAPTIVE_OVERLAP. Intents configured with a type outside
+    SEARCH_TYPE_LADDER (e.g. "auto") keep that type. When a
+    search escalates, the overlap between the cheaper type's results and
+    the next type's is recorded for the cheaper type, so the learned
+    overlap tracks how often it finds the same pages. Types whose overlap
+    has proven too low are skipped (except for occasional retries).
+    Cached responses are not counted toward latency.
+
+    Returns:
+        Tuple of (search type used, results)
+    """
+    stats = stats or SearchTypeStats()
+    learned = stats.load().get(intent, {})
+    configured = search_kwargs.get("search_type", DEFAULT_SEARCH_TYPE)
+    if configured in SEARCH_TYPE_LADDER:
+        ladder = list(SEARCH_TYPE_LADDER[:SEARCH_TYPE_LADDER.index(configured) + 1])
+    else:
+        ladder = [configured]
+
+    def trusted(search_type: str) -> Optional[float]:
+        entry = learned.get(search_type) or {}
+        return entry.get("overlap") if entry.get("n_overlap", 0) >= ADAPTIVE_MIN_SAMPLES else None
+
+    # Skip types known to be too weak, but keep probing them now and then
+    while len(ladder) > 1:
+        overlap = trusted(ladder[0])
+        if overlap is None or overlap >= ADAPTIVE_OVERLAP or random.random() < ADAPTIVE_EXPLORE:
+            break
+        ladder.pop(0)
+
+    previous = None  # (type, results) of the search we escalated from
+    for i, search_type in enumerate(ladder):
+        started = time.perf_counter()
+        results = client.search(**dict(search_kwargs, search_type=search_type)).get("results", [])
+        latency = (time.perf_counter() - started) * 1000
+        quality = search_quality(results, search_kwargs["query"], search_kwargs.get("num_results", DEFAULT_NUM_RESULTS))
+        stats.record(intent, search_type, None if client.served_locally() else latency, quality)
+
+        if previous is not None:
+            stats.record(intent, previous[0], overlap=result_overlap(previous[1], results))
+
+        overlap = trusted(search_type)
+        good = quality >= ADAPTIVE_QUALITY or (overlap is not None and overlap >= ADAPTIVE_OVERLAP)
+        if good or i == len(ladder) - 1:
+            break
+        print(
+            f"[自适应: {search_type} 质量 {quality:.2f} < {ADAPTIVE_QUALITY}, 升级到 {ladder[i + 1]}]",
+            file=sys.stderr,
+        )
+        previous = (search_type, results)
+
+    print(f"[自适应: {search_type}, 质量 {quality:.2f}, {latency:.0f} ms]", file=sys.stderr)
+    return search_type, results
+
+
+# ============================================================================
+# News Watch
+# ============================================================================
+
+class WatchState:
+    """
+    Per-query high-water mark of ``publishedDate`` and seen URLs for the
+    watch command, shared by all processes through a JSON file.
+    """
+
+    def __init__(self, path: str = WATCH_STATE):
+        self.path = path
+
+    @staticmethod
+    def make_key(intent: str, query: str) -> str:
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256(f"{intent}\n{normalized}".encode("utf-8")).hexdigest()[:16]
+
+    def load(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get(key) or {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def reset(self, key: str):
+        try:
+            update_json_file(self.path, lambda state: state.pop(key, None))
+        except OSError as e:
+            print(f"WARN: Could not update watch state: {e}", file=sys.stderr)
+
+    def advance(
+        self,
+        key: str,
+        query: str,
+        intent: str,
+        published: Optional[str],
+        urls: List[str],
+    ):
+        """Raise the high-water mark to `published` and remember `urls`; failures only warn."""
+        def update(state: Dict[str, Any]):
+            entry = state.setdefault(key, {"query": query, "intent": intent, "seen": []})
+            if published and published > (entry.get("high_water") or ""):
+                entry["high_water"] = published
+            seen = set(entry["seen"])
+            entry["seen"] = (entry["seen"] + [url for url in urls if url not in seen])[-WATCH_SEEN_MAX:]
+            entry["last_run"] = datetime.now().isoformat(timespec="seconds")
+
+        try:
+            update_json_file(self.path, update)
+        except OSError as e:
+            print(f"WARN: Could not update watch state: {e}", file=sys.stderr)
+
+
+# ============================================================================
+# Commands
+# ============================================================================
+
+def make_client(args: argparse.Namespace, pool_size: Optional[int] = None) -> ExaClient:
+    """Build an ExaClient honoring the shared cache flags."""
+    profiler = getattr(args, "profiler", None)
+    with profiler.phase("setup") if profiler is not None else contextlib.nullcontext():
+        recording = None
+        if getattr(args, "replay", None):
+            recording = SessionRecording(args.replay, replaying=True)
+        elif getattr(args, "record", None):
+            recording = SessionRecording(args.record)
+        # Recordings must see every request and replays must not depend on local state
+        cache = None if getattr(args, "no_cache", False) or recording is not None else ResponseCache()
+        coordinator = None
+        if getattr(args, "coordinate", False) or COORDINATE:
+            coordinator = get_coordinator()
+        hedger = None
+        if getattr(args, "hedge_fast", False):
+            hedger = RequestHedger("fast")
+        elif getattr(args, "hedge", False):
+            hedger = RequestHedger()
+        return ExaClient(
+            API_KEY,
+            cache=cache,
+            refresh=getattr(args, "refresh", False),
+            pool_size=pool_size,
+            coordinator=coordinator,
+            profiler=profiler,
+            index=None if recording is not None and recording.replaying else get_local_index(),
+            recording=recording,
+            hedger=hedger,
+        )
+
+
+def emit_results(
+    results: Iterable[Dict],
+    args: argparse.Namespace,
+    kind: str = "search",
+    query: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    errors: Optional[Dict[str, str]] = None,
+):
+    """
+    Print results in the format selected with --format.
 
+    Args:
+        results: API results (may be a lazy iterator when streaming)
+        args: Parsed command arguments
+        kind: "search" or "contents"
+        query: Search query, if any
+        meta: Extra top-level fields for JSON output (e.g. detected intent)
+        errors: Per-URL failures for contents fetches
+    """
+    profiler = getattr(args, "profiler", None)
+    with profiler.phase("format") if profiler is not None else contextlib.nullcontext():
+        fmt = getattr(args, "format", "markdown")
+        stream = getattr(args, "stream", False) or getattr(args, "stream_response", False)
+        render = functools.partial(
+            iter_output, fmt=fmt, kind=kind, query=query,
+            command=getattr(args, "command", None), meta=meta, errors=errors,
+        )
+
+        # Budgeting needs every result up front, so it buffers streamed results
+        max_tokens = getattr(args, "max_output_tokens", None)
+        omitted = 0
+        if max_tokens:
+            results = list(results)
+            total = len(results)
+            results = apply_output_budget(
+                results, max_tokens, fmt,
+                render=lambda fitted: "".join(render(fitted, omitted=total - len(fitted))),
+            )
+            omitted = total - len(results)
+
+        for chunk in render(results, omitted=omitted):
+            sys.stdout.write(chunk)
+            if stream:
+                sys.stdout.flush()
+
+
+def print_search(
+    client: ExaClient,
+    search_kwargs: Dict[str, Any],
+    args: argparse.Namespace,
+    meta: Optional[Dict[str, Any]] = None,
+):
+    """Run a search and print the results, block by block if streaming."""
+    prefetch = getattr(args, "prefetch", 0)
+    if getattr(args, "two_phase", False):
+        results = two_phase_search(client, search_kwargs, args.top, getattr(args, "prefer_local", False))
+        meta = dict(meta or {}, two_phase=True)
+    elif getattr(args, "adaptive", False):
+        search_type, results = adaptive_search(client, search_kwargs, (meta or {}).get("intent", "auto"))
+        meta = dict(meta or {}, search_type=search_type)
+    elif getattr(args, "stream_response", False):
+        results = client.search_stream(**search_kwargs)
+    else:
+        results = client.search(**search_kwargs).get("results", [])
+
+    urls = []
+
+    def record_urls(items: Iterable[Dict]) -> Iterator[Dict]:
+        for item in items:
+            urls.append(item.get("url"))
+            yield item
+
+    if prefetch:
+        results = record_urls(results)
+    emit_results(results, args, kind="search", query=search_kwargs["query"], meta=meta)
+    if prefetch:
+        prefetch_contents(client, urls[:prefetch])
+
+
+def two_phase_search(
+    client: ExaClient,
+    search_kwargs: Dict[str, Any],
+    top: int = TWO_PHASE_TOP,
+    prefer_local: bool = False,
+) -> List[Dict]:
+    """
+    Search with type "fast" and no contents, rank the candidates locally and
+    fetch contents only for the top results.
+
+    Returns:
+        The top results with their fetched contents, best first
+    """
+    candidates = client.search(
+        **dict(search_kwargs, search_type="fast", contents=None)
+    ).get("results", [])
+    picked = rank_candidates(
+        candidates,
+        search_kwargs["query"],
+        top,
+        prefer_domains=search_kwargs.get("include_domains"),
+        start_date=search_kwargs.get("start_published_date"),
+    )
+    print(f"[两阶段: {len(candidates)} 个候选, 抓取 {len(picked)} 个]", file=sys.stderr)
+    return attach_contents(client, picked, search_kwargs, prefer_local)
+
+
+def attach_contents(
+    client: ExaClient,
+    items: List[Dict],
+    search_kwargs: Dict[str, Any],
+    prefer_local: bool = False,
+) -> List[Dict]:
+    """
+    Fetch contents for search results found without them, using the
+    contents options in search_kwargs.
+
+    Returns:
+        The items merged with their pages (keeping each item's url and score);
+        items whose page could not be fetched are dropped with a warning
+    """
+    if not items:
+        return []
+    contents = search_kwargs.get("contents") or {"text": True}
+    result = fetch_contents(
+        client,
+        [item["url"] for item in items],
+        prefer_local,
+        text=contents.get("text", True),
+        highlights=contents.get("highlights"),
+        summary=contents.get("summary"),
+        livecrawl=contents.get("livecrawl", "fallback"),
+        cache_ttl=search_kwargs.get("cache_ttl"),
+    )
+    for url, reason in result.get("errors", {}).items():
+        print(f"WARN: {url}: {reason}", file=sys.stderr)
+    # Pages may come back under the URL they redirected to
+    pages = match_requested(result.get("results", []), [item["url"] for item in items])
+    return [
+        {**item, **pages[item["url"]], "url": item["url"], "score": item.get("score")}
+        for item in items if item["url"] in pages
+    ]
+
+
+def search_local(index: Optional[LocalIndex], search_kwargs: Dict[str, Any]) -> Optional[List[Dict]]:
+    """
+    Answer a search from the local index (--prefer-local).
+
+    Returns:
+        Local results, or None if the index has too few matches
+    """
+    if index is None:
+        return None
+    num_results = search_kwargs.get("num_results", DEFAULT_NUM_RESULTS)
+    results = index.search(
+        search_kwargs["query"],
+        limit=num_results,
+        include_domains=search_kwargs.get("include_domains"),
+        exclude_domains=search_kwargs.get("exclude_domains"),
+        start_date=search_kwargs.get("start_published_date"),
+    )
+    if len(results) < min(num_results, LOCAL_MIN_RESULTS):
+        print(f"[本地索引未命中: {len(results)} 条结果，请求网络]", file=sys.stderr)
+        return None
+    print(f"[本地索引命中: {len(results)} 条结果]", file=sys.stderr)
+    return results
+
+
+def fetch_contents(client: ExaClient, urls: List[str], prefer_local: bool, **kwargs: Any) -> Dict[str, Any]:
+    """
+    get_contents_chunked(), optionally serving URLs from the local index.
+
+    Returns:
+        {"results": [...], "errors": {url: reason}} in the original URL order
+    """
+    local = client.index.lookup(urls) if prefer_local and client.index is not None else {}
+    missing = [url for url in dict.fromkeys(urls) if url not in local]
+    if local:
+        print(f"[本地索引命中: {len(local)}/{len(local) + len(missing)} 个 URL]", file=sys.stderr)
+    if not missing:
+        return {"results": [local[url] for url in dict.fromkeys(urls)], "errors": {}}
+
+    fetched = client.get_contents_chunked(urls=missing, **kwargs)
+    if not local:
+        return fetched
+
+    remote = match_requested(fetched.get("results", []), missing)
+    results = [
+        local.get(url) or remote[url]
+        for url in dict.fromkeys(urls) if url in local or url in remote
+    ]
+    return {"results": results, "errors": fetched.get("errors", {})}
+
+
+def split_domains(domains: Any) -> Optional[List[str]]:
+    """Accept a comma-separated string or a list of domains."""
+    if not domains:
+        return None
+    if isinstance(domains, str):
+        domains = domains.split(",")
+    return [d.strip() for d in domains if d.strip()]
+
+
+def build_search_kwargs(
+    query: str,
+    search_type: str = DEFAULT_SEARCH_TYPE,
+    num_results: int = DEFAULT_NUM_RESULTS,
+    category: Optional[str] = None,
+    include_domains: Any = None,
+    exclude_domains: Any = None,
+    start_date: Optional[str] = None,
+    no_contents: bool = False,
+    highlights: bool = True,
+    summary: bool = True,
+) -> Dict[str, Any]:
+    """Build ExaClient.search() arguments for the `search` command."""
     # Build contents options
     contents = None
-    if not args.no_contents:
+    if not no_contents:
         contents = {
             "text": True,
             "livecrawl": "fallback",
         }
-        if args.highlights:
+        if highlights:
             contents["highlights"] = {
                 "numSentences": 3,
                 "highlightsPerUrl": 3,
-                "query": args.query
+                "query": query
             }
-        if args.summary:
+        if summary:
             contents["summary"] = {
-                "query": f"Summarize the key points about: {args.query}"
+                "query": f"Summarize the key points about: {query}"
             }
 
-    # Parse domains
-    include_domains = None
+    return {
+        "query": query,
+        "search_type": search_type,
+        "num_results": num_results,
+        "category": category,
+        "include_domains": split_domains(include_domains),
+        "exclude_domains": split_domains(exclude_domains),
+        "start_published_date": start_date,
+        "contents": contents,
+    }
+
+
+def build_smart_kwargs(
+    query: str,
+    intent: str = "auto",
+    num_results: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build ExaClient.search() arguments for the `smart` command.
+
+    Returns:
+        Tuple of (resolved intent, search kwargs)
+    """
+    # Detect or use specified intent
+    if intent == "auto":
+        intent = detect_intent(query)
+
+    # Get intent-based configuration
+    config = get_intent_config(intent, query)
+
+    return intent, {
+        "query": query,
+        "search_type": config["search_type"],
+        # Override with user-specified values
+        "num_results": num_results if num_results else config["num_results"],
+        "category": config.get("category"),
+        "include_domains": config.get("include_domains"),
+        "start_published_date": config.get("start_date"),
+        "contents": config.get("contents"),
+        "cache_ttl": config.get("cache_ttl"),
+    }
+
+
+def cmd_search(args: argparse.Namespace) -> int:
+    """Execute search command."""
+    client = make_client(args)
+
+    search_kwargs = build_search_kwargs(
+        query=args.query,
+        search_type=args.type,
+        num_results=args.num_results,
+        category=args.category,
+        include_domains=args.include_domains,
+        exclude_domains=args.exclude_domains,
+        start_date=args.start_date,
+        no_contents=args.no_contents,
+        highlights=args.highlights,
+        summary=args.summary,
+    )
+
+    try:
+        if args.prefer_local:
+            results = search_local(client.index, search_kwargs)
+            if results is not None:
+                emit_results(results, args, kind="search", query=args.query, meta={"source": "local"})
+                return 0
+
+        print_search(client, search_kwargs, args)
+        return 0
+
+    except requests.exceptions.HTTPError as e:
+        print(f"ERROR: API request failed: {e}", file=sys.stderr)
+        return 1
+    except requests.exceptions.Timeout:
+        print("ERROR: Request timeout", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+
+def parse_text_range(value: str) -> Tuple[int, int]:
+    """Parse --range START[:END] into character offsets (END defaults to one section later)."""
+    start, _, end = value.partition(":")
+    try:
+        start = int(start)
+        end = int(end) if end else start + CONTENTS_SECTION_CHARS
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid range {value!r}, expected START[:END]")
+    if start < 0 or end <= start:
+        raise argparse.ArgumentTypeError(f"invalid range {value!r}, expected 0 <= START < END")
+    return start, end
+
+
+def slice_text(item: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+    """A copy of a contents result holding only text[start:end], marked with its offset."""
+    text = item.get("text") or ""
+    return dict(item, text=text[start:end], _text_offset=start, _text_total_length=len(text))
+
+
+def cmd_contents(args: argparse.Namespace) -> int:
+    """Execute contents command."""
+    text_range = args.range
+    if args.section is not None:
+        if args.section < 1:
+            print("ERROR: --section must be 1 or more", file=sys.stderr)
+            return 1
+        text_range = ((args.section - 1) * CONTENTS_SECTION_CHARS, args.section * CONTENTS_SECTION_CHARS)
+
+    client = make_client(args)
+
+    try:
+        # Cached pages stay in the blob store and only the shown part is
+        # decoded, unless an output budget needs to measure whole texts
+        result = fetch_contents(
+            client,
+            args.urls,
+            args.prefer_local,
+            chunk_size=args.chunk_size,
+            max_workers=args.workers,
+            lazy_text=not args.max_output_tokens,
+            **contents_options(args.highlights, args.summary, args.livecrawl),
+        )
+
+        results = result.get("results", [])
+        if text_range is not None:
+            results = [slice_text(item, *text_range) for item in results]
+            for item in results:
+                if item["_text_offset"] >= item["_text_total_length"]:
+                    print(
+                        f"WARN: {item.get('url')}: text has only {item['_text_total_length']} characters",
+                        file=sys.stderr,
+                    )
+
+        errors = result.get("errors", {})
+        emit_results(results, args, kind="contents", errors=errors)
+        for url, reason in errors.items():
+            print(f"WARN: {url}: {reason}", file=sys.stderr)
+
+        # Partial failures still count as success
+        return 1 if errors and not result.get("results") else 0
+
+    except requests.exceptions.HTTPError as e:
+        print(f"ERROR: API request failed: {e}", file=sys.stderr)
+        return 1
+    except requests.exceptions.Timeout:
+        print("ERROR: Request timeout", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+
+def cmd_local(args: argparse.Namespace) -> int:
+    """Execute local command."""
+    index = get_local_index()
+    if index is None:
+        print("ERROR: Local index is disabled or unavailable", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    try:
+        results = index.search(
+            args.query,
+            limit=args.num_results,
+            include_domains=split_domains(args.include_domains),
+        )
+    except sqlite3.Error as e:
+        print(f"ERROR: Local index query failed: {e}", file=sys.stderr)
+        return 1
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"[本地索引: {len(results)} 条结果, {elapsed:.1f} ms]", file=sys.stderr)
+
+    emit_results(results, args, kind="search", query=args.query, meta={"source": "local"})
+    return 0
+
+
+def cmd_code(args: argparse.Namespace) -> int:
+    """Execute code context search command."""
+    client = make_client(args)
+
+    # Code-focused search: prioritize github and technical sites
+    include_domains = ["github.com", "stackoverflow.com", "dev.to", "medium.com"]
     if args.include_domains:
         include_domains = [d.strip() for d in args.include_domains.split(",")]
 
-    exclude_domains = None
-    if args.exclude_domains:
-        exclude_domains = [d.strip() for d in args.exclude_domains.split(",")]
+    contents = {
+        "text": True,
+        "livecrawl": "fallback",
+        "highlights": {
+            "numSentences": 5,
+            "highlightsPerUrl": 5,
+            "query": f"code examples and implementation for: {args.query}"
+        }
+    }
+
+    search_kwargs = {
+        "query": args.query,
+        "search_type": "deep",
+        "num_results": args.num_results,
+        "category": args.category or "github",
+        "include_domains": include_domains if not args.category else None,
+        "contents": contents,
+    }
 
     try:
-        result = client.search(
-            query=args.query,
-            search_type=args.type,
-            num_results=args.num_results,
-            category=args.category,
-            include_domains=include_domains,
-            exclude_domains=exclude_domains,
-            start_published_date=args.start_date,
-            contents=contents,
-        )
-
-        output = format_search_results(result.get("results", []), args.query)
-        print(output)
+        print_search(client, search_kwargs, args)
         return 0
 
     except requests.exceptions.HTTPError as e:
@@ -508,32 +4659,16 @@ def cmd_search(args: argparse.Namespace) -> int:
         return 1
 
 
-def cmd_contents(args: argparse.Namespace) -> int:
-    """Execute contents command."""
-    client = ExaClient(API_KEY)
-
-    highlights = None
-    if args.highlights:
-        highlights = {
-            "numSentences": 3,
-            "highlightsPerUrl": 5,
-        }
+def cmd_smart(args: argparse.Namespace) -> int:
+    """Execute smart search with automatic intent detection."""
+    client = make_client(args)
 
-    summary = None
-    if args.summary:
-        summary = {"query": "Summarize the main points"}
+    intent, search_kwargs = build_smart_kwargs(args.query, args.intent, args.num_results)
+    if args.intent == "auto":
+        print(f"[检测到意图: {intent}]", file=sys.stderr)
 
     try:
-        result = client.get_contents(
-            urls=args.urls,
-            text=True,
-            highlights=highlights,
-            summary=summary,
-            livecrawl=args.livecrawl,
-        )
-
-        output = format_contents_results(result.get("results", []))
-        print(output)
+        print_search(client, search_kwargs, args, meta={"intent": intent})
         return 0
 
     except requests.exceptions.HTTPError as e:
@@ -547,38 +4682,214 @@ def cmd_contents(args: argparse.Namespace) -> int:
         return 1
 
 
-def cmd_code(args: argparse.Namespace) -> int:
-    """Execute code context search command."""
-    client = ExaClient(API_KEY)
+def parse_batch_line(line: str, default_intent: str) -> Dict[str, Any]:
+    """
+    Parse one batch input line.
 
-    # Code-focused search: prioritize github and technical sites
-    include_domains = ["github.com", "stackoverflow.com", "dev.to", "medium.com"]
-    if args.include_domains:
-        include_domains = [d.strip() for d in args.include_domains.split(",")]
+    Plain lines are smart queries. JSON lines are objects with a "query"
+    plus optional "mode" ("smart" or "search") and per-query options, e.g.
+    {"query": "...", "intent": "news"} or
+    {"query": "...", "mode": "search", "type": "fast", "category": "github"}.
+    """
+    if not line.startswith("{"):
+        return {"mode": "smart", "query": line, "intent": default_intent}
 
-    contents = {
-        "text": True,
-        "livecrawl": "fallback",
-        "highlights": {
-            "numSentences": 5,
-            "highlightsPerUrl": 5,
-            "query": f"code examples and implementation for: {args.query}"
-        }
-    }
+    entry = json.loads(line)
+    if not entry.get("query"):
+        raise ValueError("missing \"query\"")
+    entry.setdefault("mode", "smart")
+    if entry["mode"] not in ("smart", "search"):
+        raise ValueError(f"unknown mode: {entry['mode']}")
+    if entry["mode"] == "smart":
+        entry.setdefault("intent", default_intent)
+    return entry
 
-    try:
-        result = client.search(
-            query=args.query,
-            search_type="deep",
-            num_results=args.num_results,
-            category=args.category or "github",
-            include_domains=include_domains if not args.category else None,
-            contents=contents,
+
+def run_batch_entry(
+    client: ExaClient,
+    entry: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any], List[Dict]]:
+    """
+    Run one batch entry through the smart/search request logic.
+
+    Returns:
+        Tuple of (label for progress output, JSON metadata, results)
+    """
+    query = entry["query"]
+    if entry["mode"] == "smart":
+        intent, search_kwargs = build_smart_kwargs(
+            query, entry.get("intent", "auto"), entry.get("num_results")
+        )
+        label = f"smart({intent})"
+        meta = {"mode": "smart", "intent": intent}
+    else:
+        search_kwargs = build_search_kwargs(
+            query=query,
+            search_type=entry.get("type", DEFAULT_SEARCH_TYPE),
+            num_results=entry.get("num_results", DEFAULT_NUM_RESULTS),
+            category=entry.get("category"),
+            include_domains=entry.get("include_domains"),
+            exclude_domains=entry.get("exclude_domains"),
+            start_date=entry.get("start_date"),
+            no_contents=entry.get("no_contents", False),
+            highlights=entry.get("highlights", True),
+            summary=entry.get("summary", True),
         )
+        label = "search"
+        meta = {"mode": "search"}
 
-        output = format_search_results(result.get("results", []), args.query)
-        print(output)
-        return 0
+    result = client.search(**search_kwargs)
+    return label, meta, result.get("results", [])
+
+
+def cmd_batch(args: argparse.Namespace) -> int:
+    """Execute many smart/search queries concurrently."""
+    if args.input == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    entries = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            entries.append(parse_batch_line(line, args.intent))
+        except ValueError as e:
+            print(f"ERROR: line {lineno}: {e}", file=sys.stderr)
+            return 1
+
+    if not entries:
+        print("ERROR: No queries to run", file=sys.stderr)
+        return 1
+
+    workers = max(1, min(args.workers, len(entries)))
+    client = make_client(args, pool_size=max(workers, DEFAULT_POOL_SIZE))
+
+    def run(entry: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[Dict], float]:
+        started = time.monotonic()
+        label, meta, results = run_batch_entry(client, entry)
+        return label, meta, results, time.monotonic() - started
+
+    # --format json prints one array of per-query documents at the end
+    documents = []
+    failures = 0
+    started = time.monotonic()
+    with client, concurrent_futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, entry) for entry in entries]
+
+        # Print in input order; later results wait for earlier ones
+        for i, (entry, future) in enumerate(zip(entries, futures), 1):
+            query = entry["query"]
+            try:
+                label, meta, results, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                reason = f"API request failed: {e}" if isinstance(
+                    e, requests.exceptions.HTTPError) else str(e)
+                print(f"[{i}/{len(entries)}] FAILED \"{query}\": {reason}", file=sys.stderr)
+                if args.format == "markdown":
+                    print(f"## 搜索结果: \"{query}\"\n\n请求失败: {e}\n")
+                elif args.format == "jsonl":
+                    print(json.dumps({"query": query, "error": reason}, ensure_ascii=False))
+                else:
+                    documents.append({"query": query, "error": reason, "results": []})
+                continue
+
+            print(f"[{i}/{len(entries)}] {elapsed:.2f}s {label} \"{query}\"", file=sys.stderr)
+            if args.format == "json":
+                document = {"query": query, **meta}
+                if args.max_output_tokens:
+                    total = len(results)
+
+                    def render(fitted: List[Dict]) -> str:
+                        # Measured at its nesting depth in the combined document
+                        records = list(iter_records(fitted, SEARCH_PREVIEW_CHARS))
+                        nested = {**document, "results": records, "omitted": total - len(fitted)}
+                        return json.dumps({"queries": [nested]}, ensure_ascii=False, indent=2)
+
+                    results = apply_output_budget(results, args.max_output_tokens, "json", render)
+                    if total > len(results):
+                        document["omitted"] = total - len(results)
+                document["results"] = list(iter_records(results, SEARCH_PREVIEW_CHARS))
+                documents.append(document)
+            else:
+                emit_results(results, args, kind="search", query=query)
+            sys.stdout.flush()
+
+    if args.format == "json":
+        print(json.dumps(
+            {"schema": OUTPUT_SCHEMA, "command": "batch", "queries": documents},
+            ensure_ascii=False,
+            indent=2,
+        ))
+
+    total = time.monotonic() - started
+    print(
+        f"[批量完成: {len(entries)} 个查询, 失败 {failures}, "
+        f"耗时 {total:.2f}s, 吞吐 {len(entries) / total:.2f} 查询/秒, 并发 {workers}]",
+        file=sys.stderr,
+    )
+    return 1 if failures else 0
+
+
+def cmd_multi(args: argparse.Namespace) -> int:
+    """Run related queries, merge their results and fetch each page once."""
+    queries = list(dict.fromkeys(q.strip() for q in args.queries if q.strip()))
+    if not queries:
+        print("ERROR: No queries to run", file=sys.stderr)
+        return 1
+
+    plans = [build_smart_kwargs(query, args.intent, args.num_results) for query in queries]
+    intents = [intent for intent, _ in plans]
+    # Contents options come from the most common intent across the queries
+    intent = max(intents, key=intents.count)
+    contents = get_intent_config(intent, " ".join(queries)).get("contents") or {"text": True}
+
+    workers = max(1, min(args.workers, len(queries)))
+    client = make_client(args, pool_size=max(workers, DEFAULT_POOL_SIZE))
+
+    def run(search_kwargs: Dict[str, Any]) -> List[Dict]:
+        # Search without contents; pages are fetched once after merging
+        search_kwargs = dict(search_kwargs, contents=None)
+        local = search_local(client.index, search_kwargs) if args.prefer_local else None
+        if local is not None:
+            return local
+        return client.search(**search_kwargs).get("results", [])
+
+    rankings = []
+    failures = 0
+    try:
+        with client, concurrent_futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, search_kwargs) for _, search_kwargs in plans]
+            for query, future in zip(queries, futures):
+                try:
+                    rankings.append(future.result())
+                except Exception as e:
+                    failures += 1
+                    reason = f"API request failed: {e}" if isinstance(
+                        e, requests.exceptions.HTTPError) else str(e)
+                    print(f"WARN: \"{query}\": {reason}", file=sys.stderr)
+                    rankings.append([])
+
+            if failures == len(queries):
+                print("ERROR: All queries failed", file=sys.stderr)
+                return 1
+
+            ranked = fuse_rankings(rankings)
+            fused = ranked[:args.top]
+            urls = [entry["result"]["url"] for entry in fused]
+            result = fetch_contents(
+                client,
+                urls,
+                args.prefer_local,
+                text=contents.get("text", True),
+                highlights=contents.get("highlights"),
+                summary=contents.get("summary"),
+                livecrawl=contents.get("livecrawl", "fallback"),
+            ) if urls else {"results": [], "errors": {}}
 
     except requests.exceptions.HTTPError as e:
         print(f"ERROR: API request failed: {e}", file=sys.stderr)
@@ -590,38 +4901,73 @@ def cmd_code(args: argparse.Namespace) -> int:
         print(f"ERROR: {e}", file=sys.stderr)
         return 1
 
+    # Carry search metadata and the fused score over to the fetched pages,
+    # which may come back under the URL they redirected to
+    pages = match_requested(result.get("results", []), urls)
+    merged = []
+    for entry in fused:
+        page = pages.get(entry["result"]["url"])
+        if page is None:
+            continue
+        item = {**entry["result"], **page, "url": entry["result"]["url"], "score": round(entry["score"], 4)}
+        merged.append(item)
+    merged, near_duplicates = drop_near_duplicates(merged)
 
-def cmd_smart(args: argparse.Namespace) -> int:
-    """Execute smart search with automatic intent detection."""
-    client = ExaClient(API_KEY)
+    errors = result.get("errors", {})
+    total = sum(len(results) for results in rankings)
+    print(
+        f"[合并: {len(queries)} 个查询, {total} 条结果, {len(ranked)} 个唯一 URL, "
+        f"抓取 {len(urls)} 个, 近似重复 {near_duplicates} 个, 输出 {len(merged)} 条]",
+        file=sys.stderr,
+    )
+    emit_results(
+        merged,
+        args,
+        kind="search",
+        query=" | ".join(queries),
+        meta={"queries": queries, "intent": intent},
+        errors=errors,
+    )
+    for url, reason in errors.items():
+        print(f"WARN: {url}: {reason}", file=sys.stderr)
+    return 0
 
-    # Detect or use specified intent
-    if args.intent == "auto":
-        intent = detect_intent(args.query)
-        print(f"[检测到意图: {intent}]", file=sys.stderr)
-    else:
-        intent = args.intent
 
-    # Get intent-based configuration
-    config = get_intent_config(intent, args.query)
+def cmd_watch(args: argparse.Namespace) -> int:
+    """Search for results newer than the query's last watch run and print only those."""
+    state = WatchState()
+    intent, search_kwargs = build_smart_kwargs(args.query, args.intent, args.num_results)
+    key = state.make_key(intent, args.query)
+    if args.reset:
+        state.reset(key)
+    entry = state.load(key)
+    seen = set(entry.get("seen", ()))
 
-    # Override with user-specified values
-    num_results = args.num_results if args.num_results else config["num_results"]
+    # Only ask for items published since the newest one already delivered
+    since = search_kwargs.get("start_published_date")
+    high_water = entry.get("high_water")
+    if high_water and (since is None or high_water > since):
+        since = search_kwargs["start_published_date"] = high_water
 
+    client = make_client(args)
     try:
-        result = client.search(
-            query=args.query,
-            search_type=config["search_type"],
-            num_results=num_results,
-            category=config.get("category"),
-            include_domains=config.get("include_domains"),
-            start_published_date=config.get("start_date"),
-            contents=config.get("contents"),
-        )
+        # Every poll must reach the API, but only new results' pages are fetched
+        client.refresh = True
+        try:
+            results = client.search(**dict(search_kwargs, contents=None)).get("results", [])
+        finally:
+            client.refresh = args.refresh
+        candidates = [item for item in results if canonical_url(item["url"]) not in seen]
+        new = attach_contents(client, candidates, search_kwargs)
 
-        output = format_search_results(result.get("results", []), args.query)
-        print(output)
-        return 0
+        print(
+            f"[监视: {len(results)} 条结果, {len(new)} 条新结果, 起始 {since or '不限'}]",
+            file=sys.stderr,
+        )
+        emit_results(
+            new, args, kind="search", query=args.query,
+            meta={"intent": intent, "since": since, "new": len(new)},
+        )
 
     except requests.exceptions.HTTPError as e:
         print(f"ERROR: API request failed: {e}", file=sys.stderr)
@@ -633,21 +4979,424 @@ def cmd_smart(args: argparse.Namespace) -> int:
         print(f"ERROR: {e}", file=sys.stderr)
         return 1
 
+    delivered = [canonical_url(item["url"]) for item in new]
+    # Results are ranked by relevance, not date: a full page may have left
+    # out items older than the ones returned, so the mark only moves once the
+    # window has been exhausted (the seen list covers repeats meanwhile)
+    if len(results) >= search_kwargs.get("num_results", DEFAULT_NUM_RESULTS):
+        state.advance(key, args.query, intent, None, delivered)
+        return 0
+
+    # Results that failed to fetch stay unseen, and the mark stays below the
+    # earliest of them so the next run's window still covers them; dates in
+    # the future are bad metadata and would stall the mark
+    failed = [
+        item["publishedDate"] for item in candidates
+        if item.get("publishedDate") and canonical_url(item["url"]) not in delivered
+    ]
+    ceiling = min(failed, default=None)
+    now = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    dates = [
+        item["publishedDate"] for item in results
+        if item.get("publishedDate") and item["publishedDate"] <= now
+        and (ceiling is None or item["publishedDate"] < ceiling)
+        and canonical_url(item["url"]) in seen.union(delivered)
+    ]
+    state.advance(key, args.query, intent, max(dates, default=None), delivered)
+    return 0
+
+
+def _size(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+
+
+def _ratio(raw: int, stored: int) -> str:
+    return f"{raw / stored:.1f}x" if stored else "-"
+
+
+def cmd_stats(args: argparse.Namespace) -> int:
+    """Show how much space the response cache and local index use."""
+    codec = get_text_codec()
+    report = {
+        "compression": codec.method,
+        "dictionaries": codec.usage(),
+        "cache": ResponseCache().stats(),
+        "index": None,
+        "search_types": SearchTypeStats().load(),
+    }
+    index = get_local_index()
+    if index is not None:
+        try:
+            report["index"] = index.stats()
+        except sqlite3.Error as e:
+            print(f"WARN: Local index stats failed: {e}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    cache = report["cache"]
+    dicts = report["dictionaries"]
+    lines = [
+        "## 存储统计",
+        "",
+        f"- 压缩算法: {report['compression']}，域名字典 {dicts['dictionaries']} 个 "
+        f"({_size(dicts['dictionary_bytes'])})，采样中 {dicts['sample_domains']} 个域名 "
+        f"({_size(dicts['sample_bytes'])})",
+        f"- 响应缓存: {cache['entries']} 条, 索引文件 {_size(cache['entry_bytes'])}",
+        f"- 正文块: {cache['blobs']} 个, 原始 {_size(cache['text_bytes'])} → "
+        f"压缩后 {_size(cache['blob_bytes'])} (压缩比 {_ratio(cache['text_bytes'], cache['blob_bytes'])})",
+        f"- 去重: {cache['text_references']} 次引用 → {cache['blobs']} 个正文块, "
+        f"节省 {_size(cache['dedupe_saved_bytes'])}",
+    ]
+    index_stats = report["index"]
+    if index_stats is not None:
+        lines.append(
+            f"- 本地索引: {index_stats['documents']} 篇文档, 数据库 {_size(index_stats['file_bytes'])}, "
+            f"正文 {_size(index_stats['text_bytes'])} → {_size(index_stats['stored_text_bytes'])} "
+            f"(压缩比 {_ratio(index_stats['text_bytes'], index_stats['stored_text_bytes'])})"
+        )
+    saved = (cache["text_bytes"] - cache["blob_bytes"] + cache["dedupe_saved_bytes"]
+             + (index_stats["text_bytes"] - index_stats["stored_text_bytes"] if index_stats else 0))
+    lines.append(f"- 合计节省: {_size(saved)}")
+    if report["search_types"]:
+        lines.append("- 自适应搜索类型 (与上一级结果重合度 / 质量 / 平均延迟 / 次数):")
+
+        def cell(value: Optional[float], spec: str, unit: str = "") -> str:
+            return "-" if value is None else f"{value:{spec}}{unit}"
+
+        for intent, types in sorted(report["search_types"].items()):
+            cells = [
+                f"{t} {cell(types[t].get('overlap'), '.2f')} / {cell(types[t].get('quality'), '.2f')} / "
+                f"{cell(types[t].get('latency_ms'), '.0f', ' ms')} / {types[t].get('n', 0)}"
+                for t in SEARCH_TYPE_LADDER if t in types
+            ]
+            lines.append(f"  - {intent}: " + ", ".join(cells))
+    print("\n".join(lines))
+    return 0
+
+
+# ============================================================================
+# Daemon
+# ============================================================================
+
+class _FrameWriter:
+    """Text stream that forwards writes to a daemon client as JSON frames."""
+
+    encoding = "utf-8"
+
+    def __init__(self, conn: socket.socket, fd: int, lock: threading.Lock):
+        self.conn = conn
+        self.fd = fd
+        self.lock = lock
+
+    def write(self, data: str) -> int:
+        if data:
+            send_frame(self.conn, {"fd": self.fd, "data": data}, self.lock)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def send_frame(conn: socket.socket, frame: Dict[str, Any], lock: Optional[threading.Lock] = None):
+    """Send one newline-delimited JSON frame, ignoring a vanished peer."""
+    blob = (json.dumps(frame, ensure_ascii=False) + "\n").encode("utf-8")
+    try:
+        if lock is None:
+            conn.sendall(blob)
+        else:
+            with lock:
+                conn.sendall(blob)
+    except OSError:
+        pass
+
+
+def daemon_environment() -> Dict[str, str]:
+    """The environment variables a forwarded command must share with the daemon."""
+    return {
+        name: value for name, value in os.environ.items()
+        if (name.startswith("EXA_") or name in DAEMON_ENV_NAMES) and name not in DAEMON_ENV_IGNORED
+    }
+
+
+def run_in_daemon(conn: socket.socket) -> None:
+    """
+    Run one forwarded command in the caller's working directory and stream
+    its output back.
+
+    Only one command runs at a time (cmd_serve declines the rest):
+    stdout/stderr and the working directory are swapped for the whole
+    process, so worker-thread diagnostics reach the right client. A caller
+    whose environment differs from the daemon's, or any caller once the
+    intents file has changed since startup, is declined and runs the
+    command itself.
+    """
+    line = conn.makefile("rb").readline()
+    try:
+        request = json.loads(line)
+        argv, cwd, env = request["argv"], request["cwd"], request["env"]
+    except (ValueError, KeyError, TypeError):
+        send_frame(conn, {"fd": 2, "data": "ERROR: Malformed daemon request\n"})
+        send_frame(conn, {"exit": 1})
+        return
+
+    if env != daemon_environment():
+        send_frame(conn, {"declined": "environment differs"})
+        return
+    if intents_signature() != _INTENTS_SIGNATURE:
+        send_frame(conn, {"declined": "intents file changed"})
+        return
+    home = os.getcwd()
+    try:
+        os.chdir(cwd)
+    except (OSError, TypeError):
+        send_frame(conn, {"declined": "working directory unavailable"})
+        return
+
+    lock = threading.Lock()
+    saved = sys.stdout, sys.stderr
+    sys.stdout = _FrameWriter(conn, 1, lock)
+    sys.stderr = _FrameWriter(conn, 2, lock)
+    try:
+        code = run_command(argv)
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            print(e.code, file=sys.stderr)
+            code = 1
+        else:
+            code = e.code or 0
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        code = 1
+    finally:
+        sys.stdout, sys.stderr = saved
+        os.chdir(home)
+    send_frame(conn, {"exit": code})
+
+
+def forward_to_daemon(argv: List[str], path: str = DAEMON_SOCKET) -> Optional[int]:
+    """
+    Run a command in the resident daemon, if one is listening.
+
+    The request carries this process's working directory and settings
+    (see daemon_environment); the daemon declines if the settings differ.
+
+    Returns:
+        The command's exit code, or None to run it in this process instead
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            request = {"argv": argv, "cwd": os.getcwd(), "env": daemon_environment()}
+            sock.connect(path)
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        except OSError:
+            return None
+
+        received = False
+        try:
+            for line in sock.makefile("rb"):
+                frame = json.loads(line)
+                if "declined" in frame:
+                    return None
+                if "exit" in frame:
+                    return frame["exit"]
+                stream = sys.stdout if frame["fd"] == 1 else sys.stderr
+                stream.write(frame["data"])
+                stream.flush()
+                received = True
+        except OSError:
+            pass
+
+    if not received:
+        return None
+    print("ERROR: Daemon connection closed unexpectedly", file=sys.stderr)
+    return 1
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    """Execute serve command."""
+    if not hasattr(socket, "AF_UNIX"):
+        print("ERROR: serve requires Unix domain sockets", file=sys.stderr)
+        return 1
+
+    path = args.socket
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with probe:
+            try:
+                probe.connect(path)
+                print(f"ERROR: A daemon is already listening on {path}", file=sys.stderr)
+                return 1
+            except OSError:
+                os.unlink(path)  # stale socket from a daemon that died
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # socket is private to this user
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    if args.idle_timeout > 0:
+        server.settimeout(args.idle_timeout)
+
+    # One command at a time; callers arriving meanwhile run it themselves
+    # instead of queueing behind it
+    busy = threading.Lock()
+
+    def handle(conn: socket.socket):
+        try:
+            with conn:
+                run_in_daemon(conn)
+        finally:
+            busy.release()
+
+    get_shared_session()
+    print(f"[守护进程已启动: {path}]", file=sys.stderr)
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                if busy.locked():
+                    continue
+                print("[守护进程空闲超时，退出]", file=sys.stderr)
+                break
+            conn.settimeout(None)
+            if busy.acquire(blocking=False):
+                threading.Thread(target=handle, args=(conn,), daemon=True).start()
+                continue
+            with conn:
+                conn.settimeout(DAEMON_DECLINE_TIMEOUT)
+                try:
+                    conn.makefile("rb").readline()  # unread data would reset the caller's socket
+                except OSError:
+                    continue
+                send_frame(conn, {"declined": "busy"})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
 
 # ============================================================================
 # Main
 # ============================================================================
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser for all commands."""
     parser = argparse.ArgumentParser(
         description="Exa Fetch - Enhanced web search and content fetching",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
+    # Options shared by every command
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk response cache"
+    )
+    common_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached responses but store fresh ones"
+    )
+    common_parser.add_argument(
+        "--coordinate",
+        action="store_true",
+        help="Share rate limit and identical in-flight requests with other exa_fetch processes"
+    )
+    common_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=HEDGE == "1",
+        help="Re-send requests still running at the p95 of recent latency and use the first response"
+    )
+    common_parser.add_argument(
+        "--hedge-fast",
+        action="store_true",
+        default=HEDGE == "fast",
+        help="Like --hedge, but back up slow non-fast searches with a cheaper type=fast search"
+    )
+    common_parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="markdown",
+        help="Output format: markdown (default), json document, or jsonl records"
+    )
+    common_parser.add_argument(
+        "--max-output-tokens",
+        type=int,
+        default=None,
+        help="Fit output into roughly this many tokens, sharing it across results by rank and relevance"
+    )
+    common_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-phase timing breakdown (connect, TTFB, download, decode, format) to stderr"
+    )
+    common_parser.add_argument(
+        "--metrics-file",
+        default=METRICS_FILE,
+        help="Append one JSON timing record per command to this file (default: $EXA_METRICS_FILE)"
+    )
+    session_group = common_parser.add_mutually_exclusive_group()
+    session_group.add_argument(
+        "--record",
+        metavar="DIR",
+        default=RECORD_DIR,
+        help="Save every API response to DIR for --replay, bypassing the cache (default: $EXA_RECORD)"
+    )
+    session_group.add_argument(
+        "--replay",
+        metavar="DIR",
+        default=REPLAY_DIR,
+        help="Serve API responses recorded in DIR with no network access (default: $EXA_REPLAY)"
+    )
+
+    # Streaming options for search-style commands
+    stream_parser = argparse.ArgumentParser(add_help=False)
+    stream_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print each result as soon as it is formatted"
+    )
+    stream_parser.add_argument(
+        "--stream-response",
+        action="store_true",
+        help="Parse the API response incrementally and print results as they arrive (implies --stream)"
+    )
+
+    # Prefetch option shared by search, code and smart
+    prefetch_parser = argparse.ArgumentParser(add_help=False)
+    prefetch_parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=PREFETCH_DEFAULT,
+        metavar="N",
+        help="Fetch contents of the top N results in the background so a later "
+             f"`contents` call is served from cache (default: {PREFETCH_DEFAULT})"
+    )
+
     # Search command
     search_parser = subparsers.add_parser(
         "search",
+        parents=[common_parser, stream_parser, prefetch_parser],
         help="Search the web with optional content fetching"
     )
     search_parser.add_argument("query", help="Search query")
@@ -697,11 +5446,17 @@ def main():
         dest="summary",
         help="Disable summary generation"
     )
+    search_parser.add_argument(
+        "--prefer-local",
+        action="store_true",
+        help="Answer from the local index when it has enough matches, else search the web"
+    )
     search_parser.set_defaults(func=cmd_search, highlights=True, summary=True)
 
     # Contents command
     contents_parser = subparsers.add_parser(
         "contents",
+        parents=[common_parser],
         help="Fetch content from specific URLs"
     )
     contents_parser.add_argument(
@@ -727,11 +5482,59 @@ def main():
         dest="summary",
         help="Disable summary generation"
     )
+    contents_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CONTENTS_CHUNK_SIZE,
+        help=f"URLs per request (default: {DEFAULT_CONTENTS_CHUNK_SIZE})"
+    )
+    contents_parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_CONTENTS_WORKERS,
+        help=f"Maximum parallel requests (default: {DEFAULT_CONTENTS_WORKERS})"
+    )
+    contents_parser.add_argument(
+        "--prefer-local",
+        action="store_true",
+        help="Serve URLs already in the local index and only fetch the rest"
+    )
+    text_range_group = contents_parser.add_mutually_exclusive_group()
+    text_range_group.add_argument(
+        "--section",
+        type=int,
+        default=None,
+        help=f"Print only the Nth {CONTENTS_SECTION_CHARS}-character section of each page's text"
+    )
+    text_range_group.add_argument(
+        "--range",
+        type=parse_text_range,
+        default=None,
+        metavar="START[:END]",
+        help=f"Print only these character offsets of each page's text "
+             f"(default END: START + {CONTENTS_SECTION_CHARS})"
+    )
     contents_parser.set_defaults(func=cmd_contents, highlights=True, summary=True)
 
     # Code command
+    # Two-phase retrieval options shared by code and smart
+    two_phase_parser = argparse.ArgumentParser(add_help=False)
+    two_phase_parser.add_argument(
+        "--two-phase",
+        action="store_true",
+        help="Run a fast search without contents, rank the results locally "
+             "and fetch contents only for the top ones (-n sets the candidate count)"
+    )
+    two_phase_parser.add_argument(
+        "--top", "-k",
+        type=int,
+        default=TWO_PHASE_TOP,
+        help=f"Results to fetch with --two-phase (default: {TWO_PHASE_TOP})"
+    )
+
     code_parser = subparsers.add_parser(
         "code",
+        parents=[common_parser, stream_parser, prefetch_parser, two_phase_parser],
         help="Search for code examples and implementations"
     )
     code_parser.add_argument("query", help="Code search query")
@@ -755,12 +5558,13 @@ def main():
     # Smart command (auto intent detection)
     smart_parser = subparsers.add_parser(
         "smart",
+        parents=[common_parser, stream_parser, prefetch_parser, two_phase_parser],
         help="Smart search with automatic intent detection"
     )
     smart_parser.add_argument("query", help="Search query (intent auto-detected)")
     smart_parser.add_argument(
         "--intent", "-i",
-        choices=["auto", "concept", "tutorial", "example", "github", "paper", "news", "research"],
+        choices=INTENT_CHOICES,
         default="auto",
         help="Override auto-detected intent"
     )
@@ -770,15 +5574,196 @@ def main():
         default=None,
         help="Number of results (default: intent-based)"
     )
+    smart_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        default=ADAPTIVE,
+        help="Use the cheapest search type (fast, neural, deep) whose results are good enough "
+             "for this intent, learning from past searches (default: $EXA_ADAPTIVE=1)"
+    )
     smart_parser.set_defaults(func=cmd_smart)
 
-    args = parser.parse_args()
+    # Local command
+    local_parser = subparsers.add_parser(
+        "local",
+        parents=[common_parser],
+        help="Full-text search of previously fetched pages, without network access"
+    )
+    local_parser.add_argument("query", help="Search query")
+    local_parser.add_argument(
+        "--num-results", "-n",
+        type=int,
+        default=DEFAULT_NUM_RESULTS,
+        help=f"Number of results (default: {DEFAULT_NUM_RESULTS})"
+    )
+    local_parser.add_argument(
+        "--include-domains",
+        help="Comma-separated list of domains to include"
+    )
+    local_parser.set_defaults(func=cmd_local)
+
+    # Batch command
+    batch_parser = subparsers.add_parser(
+        "batch",
+        parents=[common_parser],
+        help="Run many queries concurrently from a file or stdin"
+    )
+    batch_parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="File with one query per line, or JSONL with per-query options (default: stdin)"
+    )
+    batch_parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_BATCH_WORKERS,
+        help=f"Maximum concurrent requests (default: {DEFAULT_BATCH_WORKERS})"
+    )
+    batch_parser.add_argument(
+        "--intent", "-i",
+        choices=INTENT_CHOICES,
+        default="auto",
+        help="Intent for plain-text lines (default: auto-detect per query)"
+    )
+    batch_parser.set_defaults(func=cmd_batch)
+
+    # Multi command
+    multi_parser = subparsers.add_parser(
+        "multi",
+        parents=[common_parser],
+        help="Run related queries, merge duplicate results and fetch each page once"
+    )
+    multi_parser.add_argument("queries", nargs="+", help="Related search queries")
+    multi_parser.add_argument(
+        "--intent", "-i",
+        choices=INTENT_CHOICES,
+        default="auto",
+        help="Intent for every query (default: auto-detect per query)"
+    )
+    multi_parser.add_argument(
+        "--num-results", "-n",
+        type=int,
+        default=None,
+        help="Results per query (default: based on intent)"
+    )
+    multi_parser.add_argument(
+        "--top", "-k",
+        type=int,
+        default=DEFAULT_NUM_RESULTS,
+        help=f"Unique pages to fetch and output after merging (default: {DEFAULT_NUM_RESULTS})"
+    )
+    multi_parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_BATCH_WORKERS,
+        help=f"Maximum concurrent searches (default: {DEFAULT_BATCH_WORKERS})"
+    )
+    multi_parser.add_argument(
+        "--prefer-local",
+        action="store_true",
+        help="Answer from the local index when it has enough matches"
+    )
+    multi_parser.set_defaults(func=cmd_multi)
+
+    # Watch command
+    watch_parser = subparsers.add_parser(
+        "watch",
+        parents=[common_parser],
+        help="Print only results published or found since the query's last watch run"
+    )
+    watch_parser.add_argument("query", help="Search query to monitor")
+    watch_parser.add_argument(
+        "--intent", "-i",
+        choices=INTENT_CHOICES,
+        default="news",
+        help="Intent template for the search (default: news)"
+    )
+    watch_parser.add_argument(
+        "--num-results", "-n",
+        type=int,
+        default=None,
+        help="Results to check per run (default: based on intent)"
+    )
+    watch_parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Forget the query's high-water mark and seen URLs first"
+    )
+    watch_parser.set_defaults(func=cmd_watch)
+
+    # Stats command
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="Show cache and local index storage, compression ratio and space saved"
+    )
+    stats_parser.add_argument("--json", action="store_true", help="Print the numbers as JSON")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    # Serve command
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a resident daemon that other invocations forward to"
+    )
+    serve_parser.add_argument(
+        "--socket",
+        default=DAEMON_SOCKET,
+        help=f"Unix socket path (default: {DAEMON_SOCKET})"
+    )
+    serve_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DAEMON_IDLE_TIMEOUT,
+        help=f"Exit after this many idle seconds, 0 = never (default: {DAEMON_IDLE_TIMEOUT})"
+    )
+    serve_parser.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def run_command(argv: List[str]) -> int:
+    """Parse argv and run the selected command in this process."""
+    args = build_parser().parse_args(argv)
 
     if API_KEY == "YOUR_EXA_API_KEY_HERE":
         print("ERROR: Please set your EXA API key in the script", file=sys.stderr)
-        sys.exit(1)
+        return 1
+
+    metrics_file = getattr(args, "metrics_file", None)
+    if not (getattr(args, "profile", False) or metrics_file):
+        return args.func(args)
+
+    meta = {"query": args.query} if getattr(args, "query", None) else {}
+    args.profiler = Profiler(args.command, meta)
+    stdout = sys.stdout
+    sys.stdout = _CountingWriter(stdout, args.profiler)
+    code = None
+    try:
+        code = args.func(args)
+        return code
+    finally:
+        sys.stdout = stdout
+        args.profiler.finish(code)
+        if args.profile:
+            print(args.profiler.format_summary(), file=sys.stderr)
+        if metrics_file:
+            try:
+                args.profiler.append_to(metrics_file)
+            except OSError as e:
+                print(f"WARN: Could not write metrics to {metrics_file}: {e}", file=sys.stderr)
+
+
+def main():
+    argv = sys.argv[1:]
+    # Recorded sessions stay local so the recording holds exactly this command's requests
+    recorded = RECORD_DIR or REPLAY_DIR or any(a.split("=")[0] in ("--record", "--replay") for a in argv)
+    forward = os.environ.get("EXA_NO_DAEMON", "") != "1" and not recorded
+    if argv and argv[0] in DAEMON_COMMANDS and forward:
+        code = forward_to_daemon(argv)
+        if code is not None:
+            sys.exit(code)
 
-    sys.exit(args.func(args))
+    sys.exit(run_command(argv))
 
 
 if __name__ == "__main__":